@@ -11,43 +11,201 @@ import argparse
 import collections
 import glob
 import json
+import multiprocessing
 import os
 import pickle
-import re
-import xmltodict
 
 from common_defs import MANIPULATION_CLASSES, SOCIAL_CLASSES
+from container_archive import INDEX_NAME, get_video_name, is_archive, \
+        is_index_name, iter_archive, split_container_name
+from container_symbols import SymbolExtractor, extract_symbols
+from encoded_dataset import EncodedDataset
+from symbol_cache import SymbolCache
 
 
-FINAL_NUMBER_RE = re.compile(r"-\d+$")
+_worker_extractor = None
 
-IGNORED_SYMBOLS = set([
-    '@author', '@count', '@creationTime', '@depth', '@duration', '@entryCount',
-    '@entryCount', '@flags', '@gpscoords', '@matrix', '@modelName',
-    '@modificationTime', '@name', '@sampleCount', '@segmentDuration', '@size',
-    '@stuff', '@timescale', '@version', '@width', '@height', '@language'
-])
 
+def init_worker(keep_final_number):
+    global _worker_extractor
+    _worker_extractor = SymbolExtractor(keep_final_number)
 
-def paths_iterator(xml_dict_data, keep_final_number, current_path=[]):
-    for key, value in xml_dict_data.items():
-        if isinstance(value, dict):
-            if keep_final_number:
-                filtered_key = key
-            else:
-                filtered_key = FINAL_NUMBER_RE.sub('', key)
-            for item in paths_iterator(value, keep_final_number,
-                    current_path + [filtered_key]):
-                yield item
-        else:
-            yield "/".join(current_path + [f"{key}"])
-            if key not in IGNORED_SYMBOLS:
-                yield "/".join(current_path + [f"{key}={value}"])
+
+def extract_data_symbols(data):
+    return extract_symbols(data, _worker_extractor.keep_final_number,
+            _worker_extractor)
+
+
+def map_symbols(pool, function, items, chunk_size):
+    if pool is None:
+        return map(function, items)
+    else:
+        return pool.imap(function, items, chunk_size)
+
+
+def extract_batch(pool, cache, batch, chunk_size):
+    if cache is None:
+        return list(map_symbols(pool, extract_data_symbols,
+            [data for name, data in batch], chunk_size))
+
+    results = []
+    missing = []
+
+    for name, data in batch:
+        key, symbols = cache.get(name, data)
+        if symbols is None:
+            missing.append((len(results), key, data))
+        results.append(symbols)
+
+    missing_symbols = map_symbols(pool, extract_data_symbols,
+            [data for i, key, data in missing], chunk_size)
+
+    for (i, key, data), symbols in zip(missing, missing_symbols):
+        cache.put(key, symbols)
+        results[i] = symbols
+
+    return results
+
+
+def extract_all(args, pool, cache, containers):
+    all_symbols = []
+    batch = []
+    batch_size = max(args.workers, 1) * args.chunk_size * 4
+
+    for name, data in containers:
+        batch.append((name, data))
+
+        if len(batch) >= batch_size:
+            all_symbols.extend(extract_batch(pool, cache, batch,
+                args.chunk_size))
+            batch = []
+
+    all_symbols.extend(extract_batch(pool, cache, batch, args.chunk_size))
+
+    return all_symbols
+
+
+def list_containers(containers_path, social_class, manip_class,
+        valid_videos_names, cache):
+    xmls_dir = os.path.join(containers_path, social_class, manip_class)
+
+    containers = []
+
+    for xml_name in sorted(os.listdir(xmls_dir)):
+        video_name = get_video_name(xml_name)
+        device_id = video_name[:3]
+
+        if cache is not None:
+            cache.mark_present('/'.join((social_class, manip_class, xml_name)))
+
+        if video_name not in valid_videos_names:
+            continue
+
+        containers.append((device_id, xml_name))
+
+    return containers
+
+
+def parse_directory(args, pool, cache):
+    index_path = os.path.join(args.containers_path, INDEX_NAME)
+
+    with open(index_path, 'r') as stream:
+        valid_videos_names = set(json.load(stream))
+
+    containers = {}
+
+    for social_class in SOCIAL_CLASSES:
+        for manip_class in MANIPULATION_CLASSES:
+            containers[social_class, manip_class] = list_containers(
+                    args.containers_path, social_class, manip_class,
+                    valid_videos_names, cache)
+
+    def read_containers():
+        for (social_class, manip_class), group in containers.items():
+            print("Parsing {}/{} containers...".format(social_class,
+                manip_class))
+
+            for device_id, xml_name in group:
+                xml_path = os.path.join(args.containers_path, social_class,
+                        manip_class, xml_name)
+                with open(xml_path, 'rb') as stream:
+                    data = stream.read()
+
+                yield '/'.join((social_class, manip_class, xml_name)), data
+
+    all_symbols = iter(extract_all(args, pool, cache, read_containers()))
+
+    for key, group in containers.items():
+        containers[key] = [(device_id, next(all_symbols))
+                for device_id, xml_name in group]
+
+    return valid_videos_names, containers
+
+
+def parse_archive(args, pool, cache):
+    valid_videos_names = None
+    names = []
+
+    print("Parsing containers from {}...".format(args.containers_path))
+
+    # index.json may come after the containers in the archive, so it is only
+    # used to skip members once it has been read and to filter at the end.
+    def read_containers():
+        nonlocal valid_videos_names
+
+        for member_name, data in iter_archive(args.containers_path):
+            if is_index_name(member_name):
+                valid_videos_names = set(json.loads(data))
+                continue
+
+            container = split_container_name(member_name)
+            if container is None:
+                continue
+
+            name = '/'.join(container)
+
+            if cache is not None:
+                cache.mark_present(name)
+
+            social_class, manip_class, xml_name = container
+            if valid_videos_names is not None and \
+                    get_video_name(xml_name) not in valid_videos_names:
+                continue
+
+            names.append(container)
+            yield name, data
+
+    all_symbols = extract_all(args, pool, cache, read_containers())
+
+    if valid_videos_names is None:
+        raise FileNotFoundError("{} not found in {}".format(INDEX_NAME,
+            args.containers_path))
+
+    containers = {(social_class, manip_class): []
+            for social_class in SOCIAL_CLASSES
+            for manip_class in MANIPULATION_CLASSES}
+
+    for (social_class, manip_class, xml_name), symbols in \
+            sorted(zip(names, all_symbols), key=lambda x: x[0]):
+        video_name = get_video_name(xml_name)
+
+        if video_name not in valid_videos_names:
+            continue
+
+        containers[social_class, manip_class].append(
+                (video_name[:3], symbols))
+
+    return valid_videos_names, containers
 
 
 def get_parser():
     parser = argparse.ArgumentParser()
     parser.add_argument('--keep-final-number', action='store_true')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--chunk-size', type=int, default=32)
+    parser.add_argument('--cache-path', type=str, default=None)
+    parser.add_argument('--format', choices=['pickle', 'npz', 'store'],
+            default=None)
     parser.add_argument('containers_path')
     parser.add_argument('output_path')
 
@@ -55,10 +213,32 @@ def get_parser():
 
 
 def main(args):
-    index_path = os.path.join(args.containers_path, 'index.json')
+    if args.workers > 1:
+        pool = multiprocessing.Pool(args.workers, initializer=init_worker,
+                initargs=(args.keep_final_number,))
+    else:
+        pool = None
+        init_worker(args.keep_final_number)
+
+    if args.cache_path is not None:
+        cache = SymbolCache(args.cache_path, args.keep_final_number)
+    else:
+        cache = None
+
+    try:
+        if is_archive(args.containers_path):
+            valid_videos_names, containers = parse_archive(args, pool, cache)
+        else:
+            valid_videos_names, containers = parse_directory(args, pool,
+                    cache)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
 
-    with open(index_path, 'r') as stream:
-        valid_videos_names = set(json.load(stream))
+    if cache is not None:
+        cache.save()
+        print("Symbol cache: {}".format(cache.get_stats()))
 
     print("Total videos in index: {}".format(len(valid_videos_names)))
 
@@ -73,6 +253,8 @@ def main(args):
     for device_id, videos in videos_by_device.items():
         print("- {:3s}: {} videos".format(device_id, len(videos)))
 
+    device_ids = sorted(device_ids)
+
     sequences = {}
 
     for social_class in SOCIAL_CLASSES:
@@ -81,23 +263,8 @@ def main(args):
         for manip_class in MANIPULATION_CLASSES:
             manip_sequences = {device_id: [] for device_id in device_ids}
 
-            print("Parsing {}/{} containers...".format(social_class, manip_class))
-
-            xmls_dir = os.path.join(args.containers_path, social_class,
-                    manip_class)
-
-            for xml_name in os.listdir(xmls_dir):
-                video_name = xml_name[:xml_name.index('.')]
-                device_id = video_name[:3]
-
-                if video_name not in valid_videos_names:
-                    continue
-
-                with open(os.path.join(xmls_dir, xml_name), 'rb') as stream:
-                    data = xmltodict.parse(stream, xml_attribs=True)
-
-                manip_sequences[device_id].append(
-                        list(paths_iterator(data, args.keep_final_number)))
+            for device_id, symbols in containers[social_class, manip_class]:
+                manip_sequences[device_id].append(symbols)
 
             if manip_class.startswith('ffmpeg'):
                 if 'ffmpeg' not in social_sequences:
@@ -110,8 +277,18 @@ def main(args):
 
         sequences[social_class] = social_sequences
 
-    with open(args.output_path, 'wb') as stream:
-        pickle.dump(sequences, stream, pickle.HIGHEST_PROTOCOL)
+    output_format = args.format
+    if output_format is None:
+        output_format = 'npz' if args.output_path.endswith('.npz') \
+                else 'pickle'
+
+    if output_format == 'npz':
+        EncodedDataset.from_nested(sequences).save(args.output_path)
+    elif output_format == 'store':
+        EncodedDataset.from_nested(sequences).save_store(args.output_path)
+    else:
+        with open(args.output_path, 'wb') as stream:
+            pickle.dump(sequences, stream, pickle.HIGHEST_PROTOCOL)
 
 
 if __name__ == '__main__':
@@ -8,157 +8,87 @@
 # @Copyright: Copyright (C) 2021  Università degli studi di Firenze
 
 import argparse
-import math
+import multiprocessing
 import os
-import pickle
 
-from common_defs import BRANDS_FOR_DEVICES, find_all_symbols, \
-        find_device_ids, get_info_for_device
+from common_defs import find_device_ids, get_info_for_device, \
+        get_likelihood_path, load_dataset
+from encoded_dataset import EncodedDataset
+from likelihood_ratios import LikelihoodRatioEngine, LikelihoodRatios, \
+        save_vocabulary
 
 
-def get_freqs(sequences, all_symbols, excluded_device=None, chosen_os=None):
-    total_sequences = 1
+_worker_engine = None
 
-    freqs = {sym: 1 for sym in all_symbols}
 
-    for device_id, device_sequences in sequences.items():
-        if device_id == excluded_device:
-            continue
+def init_worker(engine):
+    global _worker_engine
+    _worker_engine = engine
 
-        if chosen_os is not None:
-            dev_brand, dev_os = get_info_for_device(device_id)
-            if dev_os != chosen_os:
-                continue
 
-        for sequence in device_sequences:
-            total_sequences += 1
-            for sym in set(sequence):
-                freqs[sym] += 1
+def save_ratios(engine, task):
+    device_id, result_path = task
 
-    for sym in all_symbols:
-        freqs[sym] /= total_sequences
+    result = LikelihoodRatios.from_engine(engine, device_id)
+    result.save(result_path)
 
-    return freqs
+    return device_id
 
 
-def get_ratio(freqs1, freqs2, all_symbols):
-    ratios = []
-    for k in all_symbols:
-        sym_ratio = math.log10(freqs1[k]) - math.log10(freqs2[k])
-        ratios.append((k, sym_ratio))
-    ratios.sort(key=lambda x: -x[1])
-    return ratios
-
-
-def extract_ratios(sequences, excluded_device=None):
-    if excluded_device:
-        filter_devices = lambda x: x != excluded_device
-    else:
-        filter_devices = None
-
-    all_symbols = find_all_symbols(sequences, filter_devices=filter_devices)
-    all_classes = []
-    all_ratios = {}
-
-    for social_class, social_sequences in sequences.items():
-        for manip_class, manip_sequences in social_sequences.items():
-            all_classes.append((social_class, manip_class))
-
-    for i, (social1, manip1) in enumerate(all_classes):
-        for j, (social2, manip2) in enumerate(all_classes):
-            if i >= j:
-                continue
-
-            freqs1 = get_freqs(sequences[social1][manip1], all_symbols,
-                    excluded_device)
-            freqs2 = get_freqs(sequences[social2][manip2], all_symbols,
-                    excluded_device)
-            ratios = get_ratio(freqs1, freqs2, all_symbols)
-
-            class_idx1 = all_classes.index((social1, manip1))
-            class_idx2 = all_classes.index((social2, manip2))
-            all_ratios[(class_idx1, class_idx2)] = ratios
-
-    return all_symbols, all_classes, all_ratios
-
-
-def extract_ratios_os(sequences, excluded_device=None):
-    if excluded_device:
-        filter_devices = lambda x: x != excluded_device
-    else:
-        filter_devices = None
-
-    all_symbols = find_all_symbols(sequences, filter_devices=filter_devices)
-    all_classes = []
-    all_ratios = {}
-
-    for social_class, social_sequences in sequences.items():
-        for manip_class, manip_sequences in social_sequences.items():
-            all_classes.append(('Android', social_class, manip_class))
-            all_classes.append(('iOS', social_class, manip_class))
-
-    for i, (os1, social1, manip1) in enumerate(all_classes):
-        for j, (os2, social2, manip2) in enumerate(all_classes):
-            if i >= j:
-                continue
-
-            freqs1 = get_freqs(sequences[social1][manip1], all_symbols,
-                    excluded_device, os1)
-            freqs2 = get_freqs(sequences[social2][manip2], all_symbols,
-                    excluded_device, os2)
-            ratios = get_ratio(freqs1, freqs2, all_symbols)
-
-            class_idx1 = all_classes.index((os1, social1, manip1))
-            class_idx2 = all_classes.index((os2, social2, manip2))
-            all_ratios[(class_idx1, class_idx2)] = ratios
-
-    return all_symbols, all_classes, all_ratios
+def save_device_ratios(task):
+    return save_ratios(_worker_engine, task)
 
 
 def get_parser():
     parser = argparse.ArgumentParser()
     parser.add_argument('--use-os-info', action='store_true')
+    parser.add_argument('--workers', type=int, default=1)
     parser.add_argument('dataset_path')
     parser.add_argument('output_path')
 
     return parser
 
 
-def main(args):
-    with open(args.dataset_path, 'rb') as stream:
-        sequences = pickle.load(stream)
-
-    all_symbols = find_all_symbols(sequences)
-
-    all_classes = []
+def compute_ratios(args, sequences, device_ids=None):
+    # Writes the folds of device_ids (all the devices if None).
+    if not isinstance(sequences, EncodedDataset):
+        sequences = EncodedDataset.from_nested(sequences)
 
-    all_ratios = {}
+    if args.use_os_info:
+        device_os = [get_info_for_device(x)[1] for x in sequences.device_ids]
+    else:
+        device_os = None
 
     os.makedirs(args.output_path, exist_ok=True)
+    save_vocabulary(args.output_path, sequences.symbols)
 
-    if args.use_os_info:
-        for device_id in find_device_ids(sequences):
-            print("Device ID: {}".format(device_id))
-            symbols, classes, ratios = extract_ratios_os(sequences, device_id)
-            result = (symbols, classes, ratios)
+    if device_ids is None:
+        device_ids = find_device_ids(sequences)
+
+    tasks = [(device_id, get_likelihood_path(args.output_path, device_id,
+        args.use_os_info)) for device_id in sorted(device_ids)]
 
-            result_path = os.path.join(args.output_path,
-                    '{}-lr-os.pkl'.format(device_id))
+    if len(tasks) == 0:
+        return
 
-            with open(result_path, 'wb') as stream:
-                pickle.dump(result, stream, pickle.HIGHEST_PROTOCOL)
+    engine = LikelihoodRatioEngine(sequences, device_os)
 
+    # The engine reaches the workers once through the pool initializer
+    # (inherited as is with the fork start method), so tasks only carry the
+    # device id and each worker writes its own fold.
+    if args.workers > 1:
+        with multiprocessing.Pool(args.workers, initializer=init_worker,
+                initargs=(engine,)) as pool:
+            for device_id in pool.imap(save_device_ratios, tasks):
+                print("Device ID: {}".format(device_id))
     else:
-        for device_id in find_device_ids(sequences):
+        for task in tasks:
+            device_id = save_ratios(engine, task)
             print("Device ID: {}".format(device_id))
-            symbols, classes, ratios = extract_ratios(sequences, device_id)
-            result = (symbols, classes, ratios)
 
-            result_path = os.path.join(args.output_path,
-                    '{}-lr.pkl'.format(device_id))
 
-            with open(result_path, 'wb') as stream:
-                pickle.dump(result, stream, pickle.HIGHEST_PROTOCOL)
+def main(args):
+    compute_ratios(args, load_dataset(args.dataset_path))
 
 
 if __name__ == '__main__':
@@ -14,29 +14,57 @@ import pickle
 from sklearn.metrics import accuracy_score, classification_report, \
         confusion_matrix
 
-from common_defs import find_all_symbols, find_device_ids, get_classifier, \
-        get_info_for_device, get_video_data, load_likelihood_data
+from common_defs import CLASSIFIERS, find_device_ids, get_info_for_device, \
+        get_likelihood_path, load_dataset, load_likelihood_data
+from fold_planner import FoldPlanner, get_task_seeds, run_folds
 
 
 def get_parser():
     parser = argparse.ArgumentParser()
     parser.add_argument('--likelihood-ratios-path', type=str, default=None)
     parser.add_argument('--use-os-info', action='store_true')
+    parser.add_argument('--jobs', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--classifier', choices=sorted(CLASSIFIERS),
+            default='tree')
+    parser.add_argument('--classifier-jobs', type=int, default=1)
     parser.add_argument('dataset_path')
     parser.add_argument('output_path')
 
     return parser
 
 
-def main(args):
-    with open(args.dataset_path, 'rb') as stream:
-        dataset = pickle.load(stream)
+def train(args, dataset, planner=None, fold_cache=None):
+    # Returns the (chosen_classes, run_symbols, classifiers, y_true, y_pred)
+    # tuple written to each output pickle, by output file name. fold_cache
+    # is passed to run_folds() with the output file names as labels names.
+    if planner is None:
+        planner = FoldPlanner(dataset)
 
     device_ids = list(sorted(find_device_ids(dataset)))
 
-    for social_name, social_sequences in dataset.items():
-        print("Social network name: {}".format(social_name))
+    fold_symbols = {}
+
+    for test_device_id in device_ids:
+        if args.likelihood_ratios_path is not None:
+            lr_path = get_likelihood_path(args.likelihood_ratios_path,
+                    test_device_id, args.use_os_info)
+
+            chosen_symbols = load_likelihood_data(lr_path, args.use_os_info)
+        else:
+            chosen_symbols = planner.get_fold_symbols(test_device_id)
+
+        chosen_symbols = list(chosen_symbols)
+        chosen_symbols.sort()
+
+        fold_symbols[test_device_id] = chosen_symbols
+
+    social_names = []
+    social_classes = {}
+    labels = []
+    tasks = []
 
+    for social_name, social_sequences in dataset.items():
         chosen_classes = []
 
         for manip_name in social_sequences.keys():
@@ -46,6 +74,39 @@ def main(args):
             else:
                 chosen_classes.append(manip_name)
 
+        def get_class(social_class, manip_name, device_id):
+            if social_class != social_name:
+                return None
+
+            if args.use_os_info:
+                device_brand, device_os = get_info_for_device(device_id)
+                videos_class = '{}-{}'.format(device_os, manip_name)
+            else:
+                videos_class = manip_name
+
+            return chosen_classes.index(videos_class)
+
+        labels.append(planner.get_labels(get_class))
+
+        social_names.append(social_name)
+        social_classes[social_name] = chosen_classes
+
+        for test_device_id in device_ids:
+            tasks.append((len(labels) - 1, test_device_id,
+                fold_symbols[test_device_id]))
+
+    seeds = get_task_seeds(args.seed, len(tasks))
+    results = iter(run_folds(planner, labels, [task + (seed,)
+        for task, seed in zip(tasks, seeds)], args.jobs, fold_cache,
+        social_names, args.classifier, args.classifier_jobs))
+
+    all_results = {}
+
+    for social_name in social_names:
+        print("Social network name: {}".format(social_name))
+
+        chosen_classes = social_classes[social_name]
+
         run_symbols = {}
         classifiers = {}
         y_true = {}
@@ -54,50 +115,12 @@ def main(args):
         for test_device_id in device_ids:
             print("Testing device {}".format(test_device_id))
 
-            if args.likelihood_ratios_path is not None:
-                lr_path = os.path.join(args.likelihood_ratios_path,
-                        '{}-lr{}.pkl'.format(test_device_id,
-                            '-os' if args.use_os_info else ''))
+            clf, test_ys, test_pred = next(results)
 
-                chosen_symbols = load_likelihood_data(lr_path, args.use_os_info)
-            else:
-                chosen_symbols = find_all_symbols(dataset,
-                        filter_devices=lambda x: x != test_device_id)
-
-            chosen_symbols = list(chosen_symbols)
-            chosen_symbols.sort()
-
-            train_xs = []
-            train_ys = []
-            test_xs = []
-            test_ys = []
-
-            for manip_name, manip_sequences in social_sequences.items():
-                for device_id, device_sequences in manip_sequences.items():
-                    if args.use_os_info:
-                        device_brand, device_os = get_info_for_device(device_id)
-                        videos_class = '{}-{}'.format(device_os, manip_name)
-                    else:
-                        videos_class = manip_name
-
-                    for device_sequence in device_sequences:
-                        video_x = get_video_data(device_sequence, chosen_symbols)
-                        video_y = chosen_classes.index(videos_class)
-
-                        if device_id == test_device_id:
-                            test_xs.append(video_x)
-                            test_ys.append(video_y)
-                        else:
-                            train_xs.append(video_x)
-                            train_ys.append(video_y)
-
-            clf = get_classifier()
-            clf.fit(train_xs, train_ys)
-
-            run_symbols[test_device_id] = chosen_symbols
+            run_symbols[test_device_id] = fold_symbols[test_device_id]
             classifiers[test_device_id] = clf
             y_true[test_device_id] = test_ys
-            y_pred[test_device_id] = clf.predict(test_xs)
+            y_pred[test_device_id] = test_pred
 
         os.makedirs(args.output_path, exist_ok=True)
         output_path = os.path.join(args.output_path, social_name + '.pkl')
@@ -106,6 +129,8 @@ def main(args):
         with open(output_path, 'wb') as stream:
             pickle.dump(result, stream, pickle.HIGHEST_PROTOCOL)
 
+        all_results[social_name] = result
+
         flat_y_true = []
         flat_y_pred = []
         for device_id in device_ids:
@@ -118,6 +143,12 @@ def main(args):
         print(classification_report(flat_y_true, flat_y_pred,
             target_names=chosen_classes))
 
+    return all_results
+
+
+def main(args):
+    train(args, load_dataset(args.dataset_path))
+
 
 if __name__ == '__main__':
     parser = get_parser()
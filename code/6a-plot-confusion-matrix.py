@@ -27,10 +27,8 @@ def get_parser():
     return parser
 
 
-def main(args):
-    with open(args.experiment_path, 'rb') as stream:
-        all_labels, run_symbols, classifiers, y_true, y_pred = \
-                pickle.load(stream)
+def plot_confusion_matrix(result, output_path):
+    all_labels, run_symbols, classifiers, y_true, y_pred = result
 
     device_ids = list(sorted(classifiers.keys()))
 
@@ -97,10 +95,17 @@ def main(args):
             text_baseline='middle')
     p.add_layout(label_set)
 
-    output_file(args.output_path, title="Decision Tree CM")
+    output_file(output_path, title="Decision Tree CM")
     save(p)
 
 
+def main(args):
+    with open(args.experiment_path, 'rb') as stream:
+        result = pickle.load(stream)
+
+    plot_confusion_matrix(result, args.output_path)
+
+
 if __name__ == '__main__':
     parser = get_parser()
     args = parser.parse_args()
@@ -20,10 +20,8 @@ def get_parser():
     return parser
 
 
-def main(args):
-    with open(args.experiment_path, 'rb') as stream:
-        all_labels, run_symbols, classifiers, y_true, y_pred = \
-                pickle.load(stream)
+def print_accuracy_by_device(result):
+    all_labels, run_symbols, classifiers, y_true, y_pred = result
 
     device_ids = list(sorted(classifiers.keys()))
 
@@ -39,6 +37,13 @@ def main(args):
         print("{:3s}: {:0.2f}".format(device_id, acc))
 
 
+def main(args):
+    with open(args.experiment_path, 'rb') as stream:
+        result = pickle.load(stream)
+
+    print_accuracy_by_device(result)
+
+
 if __name__ == '__main__':
     parser = get_parser()
     args = parser.parse_args()
@@ -21,21 +21,26 @@ def get_parser():
 
     return parser
 
-def main(args):
-    with open(args.exp_path, 'rb') as stream:
-        chosen_classes, run_symbols, classifiers, y_true, y_pred = pickle.load(stream)
+def export_trees(result, output_path):
+    chosen_classes, run_symbols, classifiers, y_true, y_pred = result
 
     device_ids = list(sorted(classifiers.keys()))
 
-    os.makedirs(args.output_path, exist_ok=True)
+    os.makedirs(output_path, exist_ok=True)
 
     for device_id in device_ids:
         clf = classifiers[device_id]
-        fig_path = os.path.join(args.output_path, device_id + '.dot')
+        fig_path = os.path.join(output_path, device_id + '.dot')
         export_graphviz(clf, out_file=fig_path,
                 feature_names=run_symbols[device_id],
                 class_names=chosen_classes)
 
+def main(args):
+    with open(args.exp_path, 'rb') as stream:
+        result = pickle.load(stream)
+
+    export_trees(result, args.output_path)
+
 if __name__ == '__main__':
     parser = get_parser()
     args = parser.parse_args()
@@ -10,7 +10,6 @@
 import argparse
 import math
 import os
-import pickle
 
 from bokeh import colors
 from bokeh.models import ColumnDataSource
@@ -20,7 +19,7 @@ import numpy as np
 
 from sklearn.metrics import confusion_matrix
 
-from common_defs import get_likelihood_symbols
+from common_defs import get_likelihood_path, get_likelihood_symbols
 
 
 def get_parser():
@@ -32,19 +31,21 @@ def get_parser():
 
 
 def main(args):
-    devices = [x[:3] for x in os.listdir(args.lr_path)]
+    devices = sorted(x[:3] for x in os.listdir(args.lr_path)
+            if x.endswith('-lr.npz'))
 
     for device_id in devices:
         print("Processing device {}".format(device_id))
         device_path = os.path.join(args.output_path, device_id)
         os.makedirs(device_path, exist_ok=True)
 
-        input_path = os.path.join(args.lr_path, '{}-lr.pkl'.format(device_id))
-        all_symbols, all_classes, all_ratios = \
-                get_likelihood_symbols(input_path)
-        all_symbols = set(all_symbols)
+        input_path = get_likelihood_path(args.lr_path, device_id, False)
+        likelihood_ratios = get_likelihood_symbols(input_path)
+        all_symbols = np.array(likelihood_ratios.get_symbols(), dtype=object)
+        all_classes = likelihood_ratios.classes
 
-        for (cls_id1, cls_id2), ratios in all_ratios.items():
+        for (cls_id1, cls_id2), ratios in zip(likelihood_ratios.pairs,
+                likelihood_ratios.ratios):
             cls1, cls2 = all_classes[cls_id1], all_classes[cls_id2]
             cls_name1, cls_name2 = '-'.join(cls1), '-'.join(cls2)
             out_name = '{}_vs_{}.html'.format(cls_name1, cls_name2)
@@ -52,9 +53,10 @@ def main(args):
             out_name_log = '{}_vs_{}.txt'.format(cls_name1, cls_name2)
             out_path_log = os.path.join(device_path, out_name_log)
 
-            valid_ratios = [(k, v) for k, v in ratios
-                    if v <= -math.log10(10) or v >= math.log10(10)]
-            valid_ratios.sort(key=lambda x: x[1])
+            valid = np.flatnonzero(np.abs(ratios) >= math.log10(10))
+            valid = valid[np.argsort(ratios[valid], kind='stable')]
+            valid_ratios = list(zip(all_symbols[valid].tolist(),
+                ratios[valid].astype(np.float64).tolist()))
 
             with open(out_path_log, 'w') as stream:
                 for sym, ratio in valid_ratios:
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# @License: GPL-3.0-or-later
+# @Copyright: Copyright (C) 2021  Università degli studi di Firenze
+
+import argparse
+import pickle
+import time
+
+import numpy as np
+from sklearn.metrics import balanced_accuracy_score
+
+from common_defs import CLASSIFIERS, find_device_ids, get_classifier, \
+        get_likelihood_path, load_dataset, load_likelihood_data
+from fold_planner import FoldPlanner, get_task_seeds
+
+
+def get_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--classifiers', nargs='+',
+            choices=sorted(CLASSIFIERS), default=list(CLASSIFIERS))
+    parser.add_argument('--classifier-jobs', type=int, default=1)
+    parser.add_argument('--likelihood-ratios-path', type=str, default=None)
+    parser.add_argument('--social-network', type=str, default='non-SN')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('dataset_path')
+
+    return parser
+
+
+def get_folds(args, dataset, planner):
+    # Leave-one-device-out folds of the tampering detector (native against
+    # tampered videos of one social network), as in
+    # 3-train_tampering_detector.py without OS information.
+    def get_class(social_class, manip_name, device_id):
+        if social_class != args.social_network:
+            return None
+        return 0 if manip_name == 'native' else 1
+
+    labels = planner.get_labels(get_class)
+    folds = []
+
+    for test_device_id in sorted(find_device_ids(dataset)):
+        if args.likelihood_ratios_path is not None:
+            lr_path = get_likelihood_path(args.likelihood_ratios_path,
+                    test_device_id, False)
+            chosen_symbols = load_likelihood_data(lr_path, False)
+        else:
+            chosen_symbols = planner.get_fold_symbols(test_device_id)
+
+        folds.append(planner.get_fold(labels, test_device_id,
+            planner.get_columns(sorted(chosen_symbols))))
+
+    return folds
+
+
+def benchmark(args, name, folds):
+    # Fits every fold once and predicts its test set right after; fit and
+    # predict are timed separately, so predict time covers the classifier
+    # alone.
+    fit_time = 0.0
+    predict_time = 0.0
+    model_size = 0
+    n_videos = 0
+    y_true = []
+    y_pred = []
+
+    seeds = get_task_seeds(args.seed, len(folds))
+
+    for (train_xs, train_ys, test_xs, test_ys), seed in zip(folds, seeds):
+        clf = get_classifier(seed, name, args.classifier_jobs)
+
+        start = time.perf_counter()
+        clf.fit(train_xs, train_ys)
+        fit_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        pred = clf.predict(test_xs)
+        predict_time += time.perf_counter() - start
+
+        model_size += len(pickle.dumps(clf, pickle.HIGHEST_PROTOCOL))
+        n_videos += len(test_ys)
+        y_true.extend(test_ys)
+        y_pred.extend(pred)
+
+    return (fit_time, n_videos / predict_time if predict_time > 0 else 0.0,
+            model_size / len(folds), balanced_accuracy_score(y_true, y_pred))
+
+
+def main(args):
+    dataset = load_dataset(args.dataset_path)
+    planner = FoldPlanner(dataset)
+    folds = get_folds(args, dataset, planner)
+
+    print("{} folds, {} training videos on average".format(len(folds),
+        int(np.mean([len(fold[1]) for fold in folds]))))
+    print("{:<24} {:>10} {:>14} {:>12} {:>10}".format('classifier',
+        'fit (s)', 'predict (v/s)', 'size (KB)', 'bal. acc.'))
+
+    for name in args.classifiers:
+        fit_time, throughput, model_size, accuracy = benchmark(args, name,
+                folds)
+        print("{:<24} {:>10.2f} {:>14.0f} {:>12.1f} {:>10.4f}".format(name,
+            fit_time, throughput, model_size / 1024, accuracy))
+
+
+if __name__ == '__main__':
+    parser = get_parser()
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+# @License: GPL-3.0-or-later
+# @Copyright: Copyright (C) 2021  Università degli studi di Firenze
+
+import argparse
+import collections
+import json
+import math
+import os
+import platform
+import sys
+import time
+import xml.parsers.expat
+
+import joblib
+import numpy as np
+import sklearn
+
+from artifact_cache import get_sources_digest
+from common_defs import CLASSIFIERS, MANIPULATION_CLASSES, SOCIAL_CLASSES, \
+        find_device_ids, get_classifier, get_info_for_device
+from container_archive import read_containers
+from container_symbols import SymbolExtractor, extract_symbols
+from encoded_dataset import EncodedDataset
+from fold_planner import FoldPlanner, get_task_seeds
+from likelihood_ratios import LikelihoodRatioEngine, LikelihoodRatios
+
+
+FORMAT_VERSION = 1
+
+STAGES = ['parse', 'extract', 'dataset', 'lr-counts', 'lr', 'encode', 'fit',
+        'predict']
+
+PERCENTILES = [50, 90, 99]
+
+SOURCES = ['container_symbols', 'encoded_dataset', 'likelihood_ratios',
+        'fold_planner', 'common_defs']
+
+
+def get_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--devices', nargs='+', default=None,
+            help='held out devices of the timed folds (default: all)')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--warmup', type=int, default=1,
+            help='untimed runs of every stage before the repeats')
+    parser.add_argument('--use-os-info', action='store_true')
+    parser.add_argument('--social-network', type=str, default='non-SN')
+    parser.add_argument('--keep-final-number', action='store_true')
+    parser.add_argument('--classifier', choices=sorted(CLASSIFIERS),
+            default='tree')
+    parser.add_argument('--classifier-jobs', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output-path', type=str, default=None,
+            help='write the results as JSON')
+    parser.add_argument('containers_path',
+            help='directory or tar archive of container XMLs')
+
+    return parser
+
+
+def get_sequences(containers, all_symbols):
+    # Nested dataset as built by 1-create_dataset.py.
+    device_ids = sorted(set(x[2] for x in containers))
+    groups = collections.defaultdict(list)
+
+    for (social_class, manip_class, device_id, data), symbols in \
+            zip(containers, all_symbols):
+        groups[social_class, manip_class, device_id].append(symbols)
+
+    sequences = {}
+
+    for social_class in SOCIAL_CLASSES:
+        social_sequences = {}
+
+        for manip_class in MANIPULATION_CLASSES:
+            name = 'ffmpeg' if manip_class.startswith('ffmpeg') \
+                    else manip_class
+            manip_sequences = social_sequences.setdefault(name,
+                    {device_id: [] for device_id in device_ids})
+
+            for device_id in device_ids:
+                manip_sequences[device_id].extend(
+                        groups[social_class, manip_class, device_id])
+
+        sequences[social_class] = social_sequences
+
+    return sequences
+
+
+class StageTimer:
+    # Samples of every stage: seconds, videos and symbol occurrences
+    # processed.
+
+    def __init__(self, warmup, repeats):
+        self.warmup = warmup
+        self.repeats = repeats
+        self.samples = collections.defaultdict(list)
+
+    def repeat(self, stage, function, *args):
+        # Runs function(*args), which returns (result, videos, symbols),
+        # warmup times untimed and then repeats times timed; returns the
+        # last result.
+        for i in range(self.warmup + self.repeats):
+            start = time.perf_counter()
+            result, n_videos, n_symbols = function(*args)
+            elapsed = time.perf_counter() - start
+
+            if i >= self.warmup:
+                self.samples[stage].append((elapsed, n_videos, n_symbols))
+
+        return result
+
+    def get_summary(self, stage):
+        samples = np.array(self.samples[stage], dtype=np.float64)
+        seconds, n_videos, n_symbols = samples.T
+
+        summary = {'samples': len(samples),
+                'seconds': dict(zip(['p{}'.format(x) for x in PERCENTILES],
+                    np.percentile(seconds, PERCENTILES).tolist()))}
+        summary['seconds']['min'] = float(seconds.min())
+        summary['seconds']['max'] = float(seconds.max())
+        summary['videos_per_second'] = float(n_videos.sum() / seconds.sum())
+        summary['symbols_per_second'] = float(n_symbols.sum() /
+                seconds.sum())
+        summary['raw_seconds'] = seconds.tolist()
+
+        return summary
+
+
+def parse_all(containers, n_symbols):
+    for social_class, manip_class, device_id, data in containers:
+        xml.parsers.expat.ParserCreate().Parse(data, True)
+    return None, len(containers), n_symbols
+
+
+def extract_all(containers, keep_final_number):
+    extractor = SymbolExtractor(keep_final_number)
+    all_symbols = [extract_symbols(data, keep_final_number, extractor)
+            for social_class, manip_class, device_id, data in containers]
+    return all_symbols, len(all_symbols), sum(len(x) for x in all_symbols)
+
+
+def build_dataset(containers, all_symbols):
+    dataset = EncodedDataset.from_nested(get_sequences(containers,
+        all_symbols))
+    return dataset, len(dataset), len(dataset.indices)
+
+
+def count_symbols(dataset, device_os):
+    return LikelihoodRatioEngine(dataset, device_os), len(dataset), \
+            len(dataset.indices)
+
+
+def compute_ratios(engine, dataset, device_id):
+    # Videos and symbols of the fold: the dataset without the held out
+    # device.
+    rows = dataset.device != dataset.device_ids.index(device_id)
+    ratios = LikelihoodRatios.from_engine(engine, device_id)
+    return ratios, int(rows.sum()), int(np.diff(dataset.indptr)[rows].sum())
+
+
+def encode_fold(planner, labels, device_id, columns):
+    fold = planner.get_fold(labels, device_id, columns)
+    train_xs, train_ys, test_xs, test_ys = fold
+    return fold, len(train_xs) + len(test_xs), \
+            int(train_xs.sum()) + int(test_xs.sum())
+
+
+def fit_fold(args, seed, train_xs, train_ys):
+    with joblib.parallel_backend('threading', n_jobs=args.classifier_jobs):
+        clf = get_classifier(seed, args.classifier, args.classifier_jobs)
+        clf.fit(train_xs, train_ys)
+    return clf, len(train_xs), int(train_xs.sum())
+
+
+def predict_fold(clf, test_xs):
+    return clf.predict(test_xs), len(test_xs), int(test_xs.sum())
+
+
+def get_labels(args, planner):
+    # Tampering detector of one social network, as in
+    # 3-train_tampering_detector.py.
+    if args.use_os_info:
+        chosen_classes = ['Android-Native', 'iOS-Native', 'Android-Tampered',
+                'iOS-Tampered']
+    else:
+        chosen_classes = ['Native', 'Tampered']
+
+    def get_class(social_class, manip_name, device_id):
+        if social_class != args.social_network:
+            return None
+
+        videos_class = 'Native' if manip_name == 'native' else 'Tampered'
+        if args.use_os_info:
+            device_brand, device_os = get_info_for_device(device_id)
+            videos_class = '{}-{}'.format(device_os, videos_class)
+
+        return chosen_classes.index(videos_class)
+
+    return planner.get_labels(get_class)
+
+
+def run_benchmark(args, containers, timer):
+    all_symbols = timer.repeat('extract', extract_all, containers,
+            args.keep_final_number)
+    timer.repeat('parse', parse_all, containers,
+            sum(len(x) for x in all_symbols))
+    dataset = timer.repeat('dataset', build_dataset, containers, all_symbols)
+
+    if args.devices is not None:
+        unknown = sorted(set(args.devices) - set(dataset.device_ids))
+        if unknown:
+            sys.exit("Unknown devices: {}".format(', '.join(unknown)))
+
+    if args.use_os_info:
+        device_os = [get_info_for_device(x)[1] for x in dataset.device_ids]
+    else:
+        device_os = None
+
+    engine = timer.repeat('lr-counts', count_symbols, dataset, device_os)
+
+    device_ids = args.devices or sorted(find_device_ids(dataset))
+    planner = FoldPlanner(dataset)
+    labels = get_labels(args, planner)
+    seeds = get_task_seeds(args.seed, len(device_ids))
+
+    for device_id, seed in zip(device_ids, seeds):
+        print("Device {}".format(device_id), file=sys.stderr)
+
+        ratios = timer.repeat('lr', compute_ratios, engine, dataset,
+                device_id)
+        columns = planner.get_columns(ratios.select_symbols(math.log10(2)))
+
+        train_xs, train_ys, test_xs, test_ys = timer.repeat('encode',
+                encode_fold, planner, labels, device_id, columns)
+        clf = timer.repeat('fit', fit_fold, args, seed, train_xs, train_ys)
+        timer.repeat('predict', predict_fold, clf, test_xs)
+
+    return dataset, device_ids
+
+
+def main(args):
+    containers = [(social_class, manip_class, video_name[:3], data)
+            for social_class, manip_class, video_name, data in
+            read_containers(args.containers_path)]
+    print("{} containers".format(len(containers)), file=sys.stderr)
+
+    timer = StageTimer(args.warmup, args.repeats)
+    dataset, device_ids = run_benchmark(args, containers, timer)
+
+    results = {
+        'version': FORMAT_VERSION,
+        'sources': get_sources_digest(*SOURCES),
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'sklearn': sklearn.__version__,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+        },
+        'options': {name: value for name, value in vars(args).items()
+            if name != 'output_path'},
+        'corpus': {
+            'videos': len(dataset),
+            'symbols': len(dataset.symbols),
+            'symbol_occurrences': len(dataset.indices),
+            'devices': device_ids,
+        },
+        'stages': {stage: timer.get_summary(stage) for stage in STAGES},
+    }
+
+    if args.output_path is not None:
+        with open(args.output_path, 'w') as stream:
+            json.dump(results, stream, indent=2)
+
+    print("{:<10} {:>8} {:>12} {:>12} {:>12} {:>12} {:>14}".format('stage',
+        'samples', 'p50 (ms)', 'p90 (ms)', 'p99 (ms)', 'videos/s',
+        'symbols/s'))
+    for stage in STAGES:
+        summary = results['stages'][stage]
+        print("{:<10} {:>8} {:>12.2f} {:>12.2f} {:>12.2f} {:>12.0f} "
+                "{:>14.0f}".format(stage, summary['samples'],
+                    *[1000 * summary['seconds']['p{}'.format(x)]
+                        for x in PERCENTILES],
+                    summary['videos_per_second'],
+                    summary['symbols_per_second']))
+
+
+if __name__ == '__main__':
+    parser = get_parser()
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+# @License: GPL-3.0-or-later
+# @Copyright: Copyright (C) 2021  Università degli studi di Firenze
+
+import argparse
+import json
+import os
+import pickle
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from classes import SOCIAL_CLASSES
+from common_defs import get_videos_data
+from compiled_tree import CompiledTree
+from container_archive import read_containers
+from container_symbols import SymbolExtractor, extract_symbols
+from lazy_inference import LazyTreePredictor
+
+
+MODELS = ['detector', 'classifier', 'blind']
+
+PERCENTILES = [50, 95, 99]
+
+
+def get_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--detector-path', type=str, default=None,
+            help='result pickle of 3-train_tampering_detector.py')
+    parser.add_argument('--classifier-path', type=str, default=None,
+            help='result pickle of 4-train_tampering_classifier.py')
+    parser.add_argument('--blind-path', type=str, default=None,
+            help='result pickle of 5-train_blind_classifier.py')
+    parser.add_argument('--device', type=str, default='D01',
+            help='held out device: its fold model predicts its containers')
+    parser.add_argument('--social-network', type=str, default=None,
+            help='only replay the containers of this social network '
+            '(default: the one the detector and classifier were trained on)')
+    parser.add_argument('--engine', choices=['sklearn', 'compiled', 'lazy'],
+            default='sklearn', help='feature vector and classifier, '
+            'compiled tree on the symbol set, or tree-guided parsing')
+    parser.add_argument('--keep-final-number', action='store_true')
+    parser.add_argument('--repeats', type=int, default=3,
+            help='warm passes over the containers')
+    parser.add_argument('--cold-runs', type=int, default=5,
+            help='fresh processes timed for the cold start')
+    parser.add_argument('--output-path', type=str, default=None,
+            help='write the results as JSON')
+    # Set on the processes started to time the cold start.
+    parser.add_argument('--cold-run', nargs=2, default=None,
+            help=argparse.SUPPRESS)
+    parser.add_argument('containers_path',
+            help='directory or tar archive of container XMLs')
+
+    return parser
+
+
+class FoldModel:
+    # The fold model of one device from a result pickle of scripts 3-5,
+    # predicting one container at a time with the given engine.
+
+    def __init__(self, path, device_id, engine='sklearn',
+            keep_final_number=False):
+        with open(path, 'rb') as stream:
+            chosen_classes, run_symbols, classifiers, y_true, y_pred = \
+                    pickle.load(stream)
+
+        self.class_names = chosen_classes
+        self.symbols = run_symbols[device_id]
+        self.clf = classifiers[device_id]
+        self.engine = engine
+        self.keep_final_number = keep_final_number
+
+        if engine != 'sklearn':
+            self.tree = CompiledTree.from_classifier(self.clf, self.symbols)
+
+        if engine == 'lazy':
+            self.lazy_predictor = LazyTreePredictor(self.tree,
+                    keep_final_number)
+        else:
+            self.extractor = SymbolExtractor(keep_final_number)
+
+    def predict(self, data):
+        # Returns the label and the seconds spent extracting the symbols and
+        # predicting; the lazy engine interleaves the two, so its extraction
+        # time is None and its prediction time covers both.
+        start = time.perf_counter()
+
+        if self.engine == 'lazy':
+            label = self.lazy_predictor.predict(data)
+            return int(label), None, time.perf_counter() - start
+
+        symbols = extract_symbols(data, self.keep_final_number,
+                self.extractor)
+        extracted = time.perf_counter()
+
+        if self.engine == 'sklearn':
+            label = self.clf.predict(get_videos_data([symbols],
+                self.symbols))[0]
+        else:
+            label = self.tree.predict_one(set(symbols))
+
+        return int(label), extracted - start, time.perf_counter() - extracted
+
+
+def get_percentiles(seconds):
+    return dict(zip(['p{}'.format(x) for x in PERCENTILES],
+        (1000 * np.percentile(seconds, PERCENTILES)).tolist()))
+
+
+def run_cold(args):
+    # Runs in a fresh process started at the given time.time(): measures the
+    # time to get here (interpreter start and imports), to load the model and
+    # to predict the container read from stdin.
+    model_path, spawned = args.cold_run
+    started = time.time()
+    data = sys.stdin.buffer.read()
+
+    start = time.perf_counter()
+    model = FoldModel(model_path, args.device, args.engine,
+            args.keep_final_number)
+    loaded = time.perf_counter()
+    model.predict(data)
+    predicted = time.perf_counter()
+
+    print(json.dumps({'startup': started - float(spawned),
+        'load': loaded - start, 'first_video': predicted - loaded}))
+
+
+def benchmark_cold(args, model_path, data):
+    command = [sys.executable, os.path.abspath(__file__), '--device',
+            args.device, '--engine', args.engine]
+    if args.keep_final_number:
+        command.append('--keep-final-number')
+
+    runs = []
+    for _ in range(args.cold_runs):
+        output = subprocess.run(command + ['--cold-run', model_path,
+            repr(time.time()), '-'], input=data, stdout=subprocess.PIPE,
+            check=True).stdout
+        run = json.loads(output)
+        run['total'] = run['startup'] + run['load'] + run['first_video']
+        runs.append(run)
+
+    return {name: get_percentiles([run[name] for run in runs])
+            for name in ['startup', 'load', 'first_video', 'total']}
+
+
+def benchmark_warm(args, model_path, containers):
+    # Containers are predicted one at a time, as they would arrive.
+    model = FoldModel(model_path, args.device, args.engine,
+            args.keep_final_number)
+    samples = {'extract': [], 'predict': [], 'total': []}
+
+    for _ in range(args.repeats):
+        for social_class, manip_class, video_name, data in containers:
+            label, extract_time, predict_time = model.predict(data)
+            if extract_time is not None:
+                samples['extract'].append(extract_time)
+            samples['predict'].append(predict_time)
+            samples['total'].append((extract_time or 0.0) + predict_time)
+
+    result = {name: get_percentiles(values)
+            for name, values in samples.items() if values}
+    result['videos'] = len(containers)
+
+    return result
+
+
+def get_social_network(model_paths):
+    # Scripts 3 and 4 train one model per social network, saved as
+    # <social network>.pkl; the blind classifier covers all of them.
+    social_networks = set()
+
+    for name in ['detector', 'classifier']:
+        if name not in model_paths:
+            continue
+
+        social_network = os.path.splitext(os.path.basename(
+            model_paths[name]))[0]
+        if social_network not in SOCIAL_CLASSES:
+            sys.exit("Cannot tell the social network of {}, give "
+                    "--social-network".format(model_paths[name]))
+        social_networks.add(social_network)
+
+    if len(social_networks) > 1:
+        sys.exit("The detector and classifier were trained on different "
+                "social networks: {}".format(', '.join(sorted(
+                    social_networks))))
+
+    return social_networks.pop() if social_networks else None
+
+
+def main(args):
+    if args.cold_run is not None:
+        run_cold(args)
+        return
+
+    model_paths = {'detector': args.detector_path,
+            'classifier': args.classifier_path, 'blind': args.blind_path}
+    model_paths = {name: path for name, path in model_paths.items()
+            if path is not None}
+    if not model_paths:
+        raise ValueError("Give at least one of --detector-path, "
+                "--classifier-path and --blind-path")
+
+    if args.social_network is None:
+        args.social_network = get_social_network(model_paths)
+
+    containers = [container for container in
+            read_containers(args.containers_path)
+            if container[2][:3] == args.device and
+            args.social_network in (None, container[0])]
+    if not containers:
+        raise ValueError("No containers of device {} in {}".format(
+            args.device, args.containers_path))
+
+    print("{} containers of device {}".format(len(containers), args.device))
+
+    results = {'options': {name: value for name, value in vars(args).items()
+        if name not in ('cold_run', 'output_path')}, 'models': {}}
+
+    print("{:<12} {:<18} {:>10} {:>10} {:>10}".format('model', 'latency',
+        'p50 (ms)', 'p95 (ms)', 'p99 (ms)'))
+
+    for name in MODELS:
+        if name not in model_paths:
+            continue
+
+        cold = benchmark_cold(args, model_paths[name], containers[0][3])
+        warm = benchmark_warm(args, model_paths[name], containers)
+        results['models'][name] = {'cold': cold, 'warm': warm}
+
+        for kind, stages in [('cold', cold), ('warm', warm)]:
+            for stage in ['startup', 'load', 'first_video', 'extract',
+                    'predict', 'total']:
+                if stage in stages:
+                    print("{:<12} {:<18} {:>10.3f} {:>10.3f} {:>10.3f}".format(
+                        name, '{}-{}'.format(kind, stage), *[
+                            stages[stage]['p{}'.format(x)]
+                            for x in PERCENTILES]))
+
+    if args.output_path is not None:
+        with open(args.output_path, 'w') as stream:
+            json.dump(results, stream, indent=2)
+
+
+if __name__ == '__main__':
+    parser = get_parser()
+    args = parser.parse_args()
+    main(args)
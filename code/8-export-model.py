@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# @License: GPL-3.0-or-later
+# @Copyright: Copyright (C) 2021  Università degli studi di Firenze
+
+import argparse
+import os
+import pickle
+import sys
+
+import numpy as np
+from sklearn.tree import DecisionTreeClassifier
+
+from common_defs import get_videos_data, load_dataset
+from encoded_dataset import EncodedDataset
+from model_bundle import ModelBundle
+
+
+def get_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--device', type=str, default=None,
+            help='fold to export; all of them, one bundle per device in '
+            'output_path, if not given')
+    parser.add_argument('--dataset-path', type=str, default=None,
+            help='also check the bundles on every video of this dataset')
+    parser.add_argument('--keep-final-number', action='store_true',
+            help='the dataset of the results was built with '
+            '--keep-final-number; recorded in the bundles so that they are '
+            'served with the same symbols')
+    parser.add_argument('exp_path')
+    parser.add_argument('output_path')
+
+    return parser
+
+
+def get_leaf_symbol_sets(tree):
+    # For every leaf, the symbols found on the way to it, which is a symbol
+    # set reaching that leaf.
+    result = []
+    pending = [(0, frozenset())]
+
+    while pending:
+        node, symbols = pending.pop()
+        if tree.is_leaf(node):
+            result.append(symbols)
+        else:
+            pending.append((int(tree.absent_child[node]), symbols))
+            pending.append((int(tree.present_child[node]),
+                symbols | {tree.symbols[tree.feature[node]]}))
+
+    return result
+
+
+def check_bundle(path, clf, run_symbols, sequences):
+    # Round trip: the bundle read back from disk must predict the same
+    # classes as the original classifier.
+    bundle = ModelBundle.load(path)
+    sequences = get_leaf_symbol_sets(bundle.tree) + sequences
+
+    expected = clf.predict(get_videos_data(sequences, run_symbols))
+    return np.array_equal(bundle.tree.predict(sequences), expected) and \
+            [bundle.tree.predict_one(x) for x in sequences] == \
+            expected.tolist()
+
+
+def main(args):
+    with open(args.exp_path, 'rb') as stream:
+        result = pickle.load(stream)
+
+    chosen_classes, run_symbols, classifiers, y_true, y_pred = result
+
+    for clf in classifiers.values():
+        if not isinstance(clf, DecisionTreeClassifier):
+            sys.exit("{} holds {} models, only tree backends can be "
+                    "exported".format(args.exp_path, type(clf).__name__))
+
+    if args.device is not None:
+        outputs = [(args.device, args.output_path)]
+    else:
+        os.makedirs(args.output_path, exist_ok=True)
+        outputs = [(device_id, os.path.join(args.output_path,
+            device_id + '.npz')) for device_id in sorted(classifiers)]
+
+    sequences = []
+    if args.dataset_path is not None:
+        dataset = load_dataset(args.dataset_path)
+        if not isinstance(dataset, EncodedDataset):
+            dataset = EncodedDataset.from_nested(dataset)
+        sequences = [set(dataset.get_sequence(row))
+                for row in range(len(dataset))]
+
+    failed = []
+
+    for device_id, output_path in outputs:
+        ModelBundle.from_result(result, device_id,
+                args.keep_final_number).save(output_path)
+        if not output_path.endswith('.npz'):
+            output_path += '.npz'
+
+        if check_bundle(output_path, classifiers[device_id],
+                run_symbols[device_id], sequences):
+            print("{}: {} ({} bytes)".format(device_id, output_path,
+                os.path.getsize(output_path)))
+        else:
+            print("{}: {} does not match the classifier".format(device_id,
+                output_path))
+            failed.append(device_id)
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    parser = get_parser()
+    args = parser.parse_args()
+    main(args)
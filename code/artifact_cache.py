@@ -0,0 +1,241 @@
+# @License: GPL-3.0-or-later
+# @Copyright: Copyright (C) 2021  Università degli studi di Firenze
+
+import collections
+import hashlib
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import time
+
+
+OBJECT_NAME = 'object.pkl'
+
+FILES_NAME = 'files'
+
+
+def get_key(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, bytes):
+            digest.update(b'b' + part)
+        else:
+            digest.update(b's' + repr(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def get_files_digest(path):
+    # Content digest of a file or of every file below a directory (relative
+    # paths included).
+    digest = hashlib.sha256()
+
+    if os.path.isfile(path):
+        with open(path, 'rb') as stream:
+            digest.update(stream.read())
+        return digest.hexdigest()
+
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            file_path = os.path.join(root, name)
+            digest.update(os.path.relpath(file_path, path).encode('utf-8'))
+            digest.update(b'\0')
+            with open(file_path, 'rb') as stream:
+                digest.update(hashlib.sha256(stream.read()).digest())
+
+    return digest.hexdigest()
+
+
+def get_sources_digest(*module_names):
+    # Digest of the source of modules next to this one, so that editing the
+    # code of a stage invalidates its cached results.
+    code_dir = os.path.dirname(os.path.abspath(__file__))
+    return get_key(*[get_files_digest(os.path.join(code_dir, name + '.py'))
+        for name in module_names])
+
+
+def get_tree_size(path):
+    size = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            size += os.path.getsize(os.path.join(root, name))
+    return size
+
+
+class ArtifactCache:
+    # Stage results stored by key, either as a pickled object or as a tree
+    # of files. Every entry is a directory whose modification time records
+    # its last use; once the total size goes over max_size bytes the least
+    # recently used entries are removed. Entries are written to a temporary
+    # directory and renamed into place, so readers never see partial ones;
+    # entries being read are pinned, so that eviction from another thread
+    # leaves them in place until the read is done.
+
+    def __init__(self, path, max_size):
+        self.path = path
+        self.max_size = max_size
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self._pins = collections.Counter()
+        self._lock = threading.Lock()
+
+        os.makedirs(path, exist_ok=True)
+
+        for prefix in os.listdir(path):
+            prefix_path = os.path.join(path, prefix)
+            if prefix.endswith('.tmp'):
+                # Left behind by a process that died while writing or
+                # evicting an entry.
+                shutil.rmtree(prefix_path, ignore_errors=True)
+                continue
+            if len(prefix) != 2 or not os.path.isdir(prefix_path):
+                continue
+            for key in os.listdir(prefix_path):
+                entry_path = os.path.join(prefix_path, key)
+                self.entries[key] = (get_tree_size(entry_path),
+                        os.path.getmtime(entry_path))
+
+    def get_entry_path(self, key):
+        return os.path.join(self.path, key[:2], key)
+
+    def get_files_path(self, key):
+        return os.path.join(self.get_entry_path(key), FILES_NAME)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def pin(self, key):
+        # Marks the entry as used and keeps it from being evicted until
+        # unpin(); False if there is no such entry.
+        with self._lock:
+            if key not in self.entries:
+                self.misses += 1
+                return False
+
+            self.hits += 1
+            self._pins[key] += 1
+            now = time.time()
+            os.utime(self.get_entry_path(key), (now, now))
+            self.entries[key] = (self.entries[key][0], now)
+            return True
+
+    def unpin(self, key):
+        with self._lock:
+            self._pins[key] -= 1
+            if self._pins[key] == 0:
+                del self._pins[key]
+
+    def get(self, key):
+        if not self.pin(key):
+            return None
+
+        try:
+            with open(os.path.join(self.get_entry_path(key), OBJECT_NAME),
+                    'rb') as stream:
+                return pickle.load(stream)
+        finally:
+            self.unpin(key)
+
+    def put(self, key, value):
+        def write(tmp_path):
+            with open(os.path.join(tmp_path, OBJECT_NAME), 'wb') as stream:
+                pickle.dump(value, stream, pickle.HIGHEST_PROTOCOL)
+
+        self.add_entry(key, write)
+
+    def get_files(self, key, output_path):
+        # Copies the files of an entry to output_path, replacing whatever
+        # was there; False if missing.
+        if not self.pin(key):
+            return False
+
+        try:
+            files_path = self.get_files_path(key)
+            output_dir = os.path.dirname(output_path) or '.'
+            os.makedirs(output_dir, exist_ok=True)
+            if os.path.isdir(files_path):
+                tmp_path = tempfile.mkdtemp(suffix='.tmp', dir=output_dir)
+                try:
+                    shutil.copytree(files_path, tmp_path, dirs_exist_ok=True)
+                    if os.path.isdir(output_path):
+                        shutil.rmtree(output_path)
+                    os.rename(tmp_path, output_path)
+                except BaseException:
+                    shutil.rmtree(tmp_path, ignore_errors=True)
+                    raise
+            else:
+                shutil.copyfile(files_path, output_path)
+        finally:
+            self.unpin(key)
+        return True
+
+    def put_files(self, key, input_path):
+        def write(tmp_path):
+            files_path = os.path.join(tmp_path, FILES_NAME)
+            if os.path.isdir(input_path):
+                shutil.copytree(input_path, files_path)
+            else:
+                shutil.copyfile(input_path, files_path)
+
+        self.add_entry(key, write)
+
+    def add_entry(self, key, write):
+        entry_path = self.get_entry_path(key)
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+
+        tmp_path = tempfile.mkdtemp(suffix='.tmp', dir=self.path)
+        try:
+            write(tmp_path)
+            size = get_tree_size(tmp_path)
+        except BaseException:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+
+        with self._lock:
+            try:
+                os.rename(tmp_path, entry_path)
+                tmp_path = None
+            except OSError:
+                # Another writer stored the same key first.
+                if not os.path.isdir(entry_path):
+                    shutil.rmtree(tmp_path, ignore_errors=True)
+                    raise
+            self.entries[key] = (size, time.time())
+
+        if tmp_path is not None:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+        self.evict()
+
+    def evict(self):
+        with self._lock:
+            total_size = sum(size for size, _ in self.entries.values())
+            evicted = []
+            for key, (size, _) in sorted(self.entries.items(),
+                    key=lambda x: x[1][1]):
+                if total_size <= self.max_size:
+                    break
+                if key in self._pins:
+                    continue
+                del self.entries[key]
+                total_size -= size
+
+                # Moved out of the way under the lock, so that the key can be
+                # stored again while the old files are being removed.
+                trash_path = tempfile.mkdtemp(suffix='.tmp', dir=self.path)
+                os.rename(self.get_entry_path(key),
+                        os.path.join(trash_path, key))
+                evicted.append(trash_path)
+            self.evicted += len(evicted)
+
+        for trash_path in evicted:
+            shutil.rmtree(trash_path, ignore_errors=True)
+
+    def get_stats(self):
+        return "{} hits, {} misses, {} evicted, {} entries".format(
+                self.hits, self.misses, self.evicted, len(self.entries))
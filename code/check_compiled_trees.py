@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# @License: GPL-3.0-or-later
+# @Copyright: Copyright (C) 2021  Università degli studi di Firenze
+
+import argparse
+import os
+import pickle
+import sys
+
+import numpy as np
+
+from common_defs import load_dataset
+from compiled_tree import CompiledTree
+from fold_planner import FoldPlanner
+
+
+def get_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('dataset_path')
+    parser.add_argument('results_path', help='results pickle or directory')
+
+    return parser
+
+
+def find_results(results_path):
+    if os.path.isfile(results_path):
+        return [results_path]
+
+    paths = []
+    for root, dirs, files in os.walk(results_path):
+        dirs.sort()
+        paths.extend(os.path.join(root, name) for name in sorted(files)
+                if name.endswith('.pkl'))
+    return paths
+
+
+def check_result(planner, result):
+    # Compares the compiled trees with clf.predict() on every video of the
+    # dataset: the batch evaluator on all of them, the single-video one on
+    # the videos of the held out device. Returns the number of trees checked
+    # and the devices whose trees mismatch.
+    chosen_classes, run_symbols, classifiers, y_true, y_pred = result
+    dataset = planner.dataset
+    rows = np.arange(len(dataset))
+    sequences = [set(dataset.get_sequence(row)) for row in rows]
+    n_checked = 0
+    failed = []
+
+    for device_id in sorted(classifiers):
+        clf = classifiers[device_id]
+        if not hasattr(clf, 'tree_'):
+            continue
+        n_checked += 1
+
+        expected = clf.predict(planner.get_matrix(rows,
+            planner.get_columns(run_symbols[device_id])))
+
+        tree = CompiledTree.from_classifier(clf, run_symbols[device_id])
+        membership = planner.get_matrix(rows, planner.get_columns(
+            tree.symbols))
+
+        if device_id in dataset.device_ids:
+            test_rows = np.flatnonzero(dataset.device ==
+                    dataset.device_ids.index(device_id))
+        else:
+            test_rows = []
+
+        if not (np.array_equal(tree.predict_membership(membership), expected)
+                and np.array_equal(tree.predict(sequences), expected)
+                and all(tree.predict_one(sequences[row]) == expected[row]
+                    for row in test_rows)):
+            failed.append(device_id)
+
+    return n_checked, failed
+
+
+def main(args):
+    planner = FoldPlanner(load_dataset(args.dataset_path))
+    n_failed = 0
+
+    for path in find_results(args.results_path):
+        with open(path, 'rb') as stream:
+            result = pickle.load(stream)
+
+        n_checked, failed = check_result(planner, result)
+        n_failed += len(failed)
+
+        if failed:
+            print("{}: compiled trees differ for {}".format(path,
+                ', '.join(failed)))
+        else:
+            print("{}: {} trees OK".format(path, n_checked))
+
+    if n_failed > 0:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    parser = get_parser()
+    args = parser.parse_args()
+    main(args)
@@ -12,6 +12,8 @@ import json
 import os
 
 from common_defs import MANIPULATION_CLASSES, SOCIAL_CLASSES
+from container_archive import INDEX_NAME, get_video_name, is_archive, \
+        is_index_name, iter_archive, split_container_name
 
 
 def get_parser():
@@ -21,25 +23,58 @@ def get_parser():
     return parser
 
 
-def main(args):
-    index_path = os.path.join(args.containers_path, 'index.json')
+def list_archive(containers_path):
+    index = None
+    video_ids = {}
+
+    for member_name, data in iter_archive(containers_path, is_index_name):
+        container = split_container_name(member_name)
+
+        if container is not None:
+            social, manip, filename = container
+            video_ids.setdefault((social, manip), set()).add(
+                    get_video_name(filename))
+        elif is_index_name(member_name):
+            index = json.loads(data)
+
+    if index is None:
+        raise FileNotFoundError("{} not found in {}".format(INDEX_NAME,
+            containers_path))
+
+    return index, video_ids
+
+
+def list_directory(containers_path):
+    index_path = os.path.join(containers_path, INDEX_NAME)
 
     with open(index_path, 'r') as stream:
         index = json.load(stream)
 
+    video_ids = {}
+
+    for social in SOCIAL_CLASSES:
+        for manip in MANIPULATION_CLASSES:
+            manip_path = os.path.join(containers_path, social, manip)
+            video_ids[social, manip] = set(get_video_name(filename)
+                    for filename in os.listdir(manip_path))
+
+    return index, video_ids
+
+
+def main(args):
+    if is_archive(args.containers_path):
+        index, video_ids = list_archive(args.containers_path)
+    else:
+        index, video_ids = list_directory(args.containers_path)
+
     device_ids = set(x[:3] for x in index)
     device_ids = list(sorted(device_ids))
 
     for social in SOCIAL_CLASSES:
-        social_path = os.path.join(args.containers_path, social)
-
         for manip in MANIPULATION_CLASSES:
-            manip_path = os.path.join(social_path, manip)
-
             this_index = set(index)
 
-            for filename in os.listdir(manip_path):
-                video_id = filename[:filename.index('.')]
+            for video_id in video_ids.get((social, manip), ()):
                 if video_id in this_index:
                     this_index.remove(video_id)
 
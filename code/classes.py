@@ -0,0 +1,11 @@
+# @License: GPL-3.0-or-later
+# @Copyright: Copyright (C) 2021  Università degli studi di Firenze
+
+# Class names of the corpus, without dependencies: scripts that only read
+# containers import them from here rather than from common_defs, which
+# loads scikit-learn.
+
+SOCIAL_CLASSES = ["Facebook", "Tiktok", "Weibo", "Youtube", "non-SN"]
+
+MANIPULATION_CLASSES = ['avidemux', 'exiftool', 'ffmpeg1', 'ffmpeg2',
+        'ffmpeg3', 'ffmpeg4', 'ffmpeg5', 'kdenlive', 'native', 'premiere']
@@ -6,16 +6,20 @@
 # @License: GPL-3.0-or-later
 # @Copyright: Copyright (C) 2021  Università degli studi di Firenze
 
+import inspect
 import math
+import os
 import pickle
 
+import numpy as np
+from sklearn.ensemble import ExtraTreesClassifier, RandomForestClassifier
+from sklearn.naive_bayes import BernoulliNB
 from sklearn.tree import DecisionTreeClassifier
 
+from classes import MANIPULATION_CLASSES, SOCIAL_CLASSES
+from encoded_dataset import EncodedDataset
+from likelihood_ratios import LikelihoodRatios
 
-SOCIAL_CLASSES = ["Facebook", "Tiktok", "Weibo", "Youtube", "non-SN"]
-
-MANIPULATION_CLASSES = ['avidemux', 'exiftool', 'ffmpeg1', 'ffmpeg2',
-        'ffmpeg3', 'ffmpeg4', 'ffmpeg5', 'kdenlive', 'native', 'premiere']
 
 BRANDS_FOR_DEVICES = {
     'D01': 'Samsung',
@@ -56,8 +60,25 @@ BRANDS_FOR_DEVICES = {
 }
 
 
+def load_dataset(dataset_path):
+    if os.path.isdir(dataset_path):
+        return EncodedDataset.open_store(dataset_path)
+
+    if dataset_path.endswith('.npz'):
+        return EncodedDataset.load(dataset_path)
+
+    with open(dataset_path, 'rb') as stream:
+        return pickle.load(stream)
+
+
 def find_all_symbols(dataset, filter_socials=None, filter_manipulations=None,
         filter_devices=None):
+    if isinstance(dataset, EncodedDataset):
+        rows_mask = dataset.get_rows_mask(filter_socials,
+                filter_manipulations, filter_devices)
+        return [dataset.symbols[i] for i in
+                dataset.get_symbol_ids(rows_mask)]
+
     all_symbols = set()
 
     for social_class, social_sequences in dataset.items():
@@ -84,6 +105,9 @@ def find_all_symbols(dataset, filter_socials=None, filter_manipulations=None,
 
 
 def find_device_ids(dataset):
+    if isinstance(dataset, EncodedDataset):
+        return set(dataset.device_ids)
+
     device_ids = set()
 
     for social_class, social_sequences in dataset.items():
@@ -95,6 +119,13 @@ def find_device_ids(dataset):
 
 
 def get_info_for_device(device_id):
+    if device_id not in BRANDS_FOR_DEVICES:
+        # Devices of a synthetic corpus take the brand of the real device
+        # they are modeled on; get_source_device() raises KeyError for
+        # anything else.
+        from generate_containers import get_source_device
+        device_id = get_source_device(device_id)
+
     brand = BRANDS_FOR_DEVICES[device_id]
 
     if brand == 'Apple':
@@ -105,31 +136,24 @@ def get_info_for_device(device_id):
         return brand, 'Android'
 
 
-def get_likelihood_symbols(lr_path):
-    with open(lr_path, 'rb') as stream:
-        all_symbols, all_classes, all_ratios = pickle.load(stream)
+def get_likelihood_path(lr_dir, device_id, use_os_info):
+    return os.path.join(lr_dir, '{}-lr{}.npz'.format(device_id,
+        '-os' if use_os_info else ''))
 
-    return all_symbols, all_classes, all_ratios
 
+def get_likelihood_symbols(lr_path):
+    return LikelihoodRatios.load(lr_path)
 
-def load_likelihood_data(lr_path, use_os_info):
-    with open(lr_path, 'rb') as stream:
-        all_symbols, all_classes, all_ratios = pickle.load(stream)
 
-    chosen_symbols = set()
+def load_likelihood_data(lr_path, use_os_info):
+    likelihood_ratios = LikelihoodRatios.load(lr_path, load_ratios=False)
 
     if use_os_info:
-        assert all(len(c) == 3 for c in all_classes)
+        assert all(len(c) == 3 for c in likelihood_ratios.classes)
     else:
-        assert all(len(c) == 2 for c in all_classes)
-
-    for ratio_key, ratio_values in all_ratios.items():
-
-        for sym, sym_lr in ratio_values:
-            if sym_lr <= -math.log10(2) or sym_lr >= math.log10(2):
-                chosen_symbols.add(sym)
+        assert all(len(c) == 2 for c in likelihood_ratios.classes)
 
-    return chosen_symbols
+    return set(likelihood_ratios.select_symbols(math.log10(2)))
 
 
 def get_video_data(sequence, chosen_symbols):
@@ -144,5 +168,75 @@ def get_video_data(sequence, chosen_symbols):
     return result
 
 
-def get_classifier():
-    return DecisionTreeClassifier(class_weight='balanced', min_samples_leaf=12)
+def get_videos_data(sequences, chosen_symbols):
+    # Batch equivalent of get_video_data(): row i of the returned matrix holds
+    # the same 0/1 features as get_video_data(sequences[i], chosen_symbols).
+    # The matrix is dense on purpose: sklearn grows different (tie-breaking)
+    # trees from sparse input, while uint8 gives the same trees as the lists.
+    columns = {sym: i for i, sym in enumerate(chosen_symbols)}
+
+    rows = []
+    indices = []
+
+    for row, sequence in enumerate(sequences):
+        row_indices = [columns[sym] for sym in sequence if sym in columns]
+        rows.extend([row] * len(row_indices))
+        indices.extend(row_indices)
+
+    result = np.zeros((len(sequences), len(chosen_symbols)), dtype=np.uint8)
+    result[rows, indices] = 1
+
+    return result
+
+
+def get_tree_classifier(random_state, n_jobs):
+    return DecisionTreeClassifier(class_weight='balanced', min_samples_leaf=12,
+            random_state=random_state)
+
+
+def get_random_forest_classifier(random_state, n_jobs):
+    return RandomForestClassifier(n_estimators=100, class_weight='balanced',
+            min_samples_leaf=12, n_jobs=n_jobs, random_state=random_state)
+
+
+def get_extra_trees_classifier(random_state, n_jobs):
+    return ExtraTreesClassifier(n_estimators=100, class_weight='balanced',
+            min_samples_leaf=12, n_jobs=n_jobs, random_state=random_state)
+
+
+def get_hist_gradient_boosting_classifier(random_state, n_jobs):
+    # Needs dense input; the 0/1 features fall in two bins each. Its threads
+    # are set through OMP_NUM_THREADS rather than n_jobs. Imported here:
+    # before scikit-learn 1.0 it has to be enabled as experimental, and
+    # class_weight only exists since 1.2.
+    try:
+        from sklearn.ensemble import HistGradientBoostingClassifier
+    except ImportError:
+        from sklearn.experimental import enable_hist_gradient_boosting
+        from sklearn.ensemble import HistGradientBoostingClassifier
+
+    params = {'min_samples_leaf': 12, 'random_state': random_state}
+    if 'class_weight' in inspect.signature(
+            HistGradientBoostingClassifier).parameters:
+        params['class_weight'] = 'balanced'
+
+    return HistGradientBoostingClassifier(**params)
+
+
+def get_bernoulli_nb_classifier(random_state, n_jobs):
+    return BernoulliNB(alpha=1.0)
+
+
+CLASSIFIERS = {
+    'tree': get_tree_classifier,
+    'random-forest': get_random_forest_classifier,
+    'extra-trees': get_extra_trees_classifier,
+    'hist-gradient-boosting': get_hist_gradient_boosting_classifier,
+    'bernoulli-nb': get_bernoulli_nb_classifier,
+}
+
+
+def get_classifier(random_state=None, name='tree', n_jobs=1):
+    # name is one of CLASSIFIERS; n_jobs is the number of threads used by
+    # the ensembles to fit and predict.
+    return CLASSIFIERS[name](random_state, n_jobs)
@@ -0,0 +1,118 @@
+# @License: GPL-3.0-or-later
+# @Copyright: Copyright (C) 2021  Università degli studi di Firenze
+
+import numpy as np
+
+
+class CompiledTree:
+    # A fitted decision tree over 0/1 symbol features as flat arrays, walked
+    # by testing whether each split symbol is in a video's symbol set.
+    # symbols holds the symbols the tree splits on; for node i, feature[i]
+    # is the index of its symbol in symbols (-1 for leaves), absent_child[i]
+    # and present_child[i] the node to visit when the symbol is missing or
+    # present, and leaf_class[i] the index in classes of the prediction.
+
+    def __init__(self, symbols, feature, absent_child, present_child,
+            leaf_class, classes):
+        self.symbols = list(symbols)
+        self.feature = np.asarray(feature, dtype=np.int32)
+        self.absent_child = np.asarray(absent_child, dtype=np.int32)
+        self.present_child = np.asarray(present_child, dtype=np.int32)
+        self.leaf_class = np.asarray(leaf_class, dtype=np.int32)
+        self.classes = np.asarray(classes)
+
+        self._symbol_ids = {sym: i for i, sym in enumerate(self.symbols)}
+        self._nodes = list(zip(
+            [self.symbols[i] if i >= 0 else None for i in self.feature],
+            self.absent_child.tolist(), self.present_child.tolist()))
+        self._predictions = self.classes[self.leaf_class].tolist()
+
+    @classmethod
+    def from_classifier(cls, clf, feature_names):
+        # clf is a fitted single-output DecisionTreeClassifier over the
+        # features named by feature_names (e.g. run_symbols[device_id]).
+        # Only the attributes of the fitted tree are read, so sklearn is not
+        # needed here.
+        if not hasattr(clf, 'tree_'):
+            raise ValueError("Only decision trees can be compiled, not "
+                    "{}".format(type(clf).__name__))
+
+        tree = clf.tree_
+        if tree.n_outputs != 1:
+            raise ValueError("Only single-output trees can be compiled")
+
+        internal = tree.children_left >= 0
+        used_features = np.unique(tree.feature[internal])
+        feature = np.full(tree.node_count, -1, dtype=np.int32)
+        feature[internal] = np.searchsorted(used_features,
+                tree.feature[internal])
+
+        # sklearn sends x <= threshold to the left child; the feature values
+        # are 0 (absent) and 1 (present).
+        threshold = tree.threshold
+        absent_child = np.where(internal & (0 > threshold),
+                tree.children_right, tree.children_left)
+        present_child = np.where(internal & (1 > threshold),
+                tree.children_right, tree.children_left)
+
+        # Same as clf.predict(): the first class with the largest value.
+        leaf_class = np.argmax(tree.value[:, 0, :], axis=1)
+
+        return cls([feature_names[i] for i in used_features], feature,
+                absent_child, present_child, leaf_class, clf.classes_)
+
+    def predict_one(self, symbol_set):
+        # O(depth) membership tests on one video's set of symbols.
+        nodes = self._nodes
+        node = 0
+        sym, absent, present = nodes[0]
+        while sym is not None:
+            node = present if sym in symbol_set else absent
+            sym, absent, present = nodes[node]
+        return self._predictions[node]
+
+    def advance(self, node, symbol_set):
+        # Follows the present children from node while their symbols are in
+        # symbol_set; returns the leaf or the first node still undecided.
+        nodes = self._nodes
+        sym, absent, present = nodes[node]
+        while sym is not None and sym in symbol_set:
+            node = present
+            sym, absent, present = nodes[node]
+        return node
+
+    def is_leaf(self, node):
+        return self._nodes[node][0] is None
+
+    def get_membership(self, symbol_sets):
+        # Boolean matrix of the tree symbols found in each video; trees split
+        # on few symbols, so each one is looked up in every set.
+        result = np.zeros((len(symbol_sets), len(self.symbols)), dtype=bool)
+        for i, sym in enumerate(self.symbols):
+            result[:, i] = [sym in symbol_set for symbol_set in symbol_sets]
+        return result
+
+    def apply_membership(self, membership):
+        # Leaf reached by each row of membership, walking all the videos
+        # one tree level at a time.
+        membership = np.asarray(membership, dtype=bool)
+        nodes = np.zeros(len(membership), dtype=np.int32)
+        rows = np.arange(len(membership))
+
+        active = rows[self.feature[nodes] >= 0]
+        while len(active) > 0:
+            current = nodes[active]
+            present = membership[active, self.feature[current]]
+            nodes[active] = np.where(present, self.present_child[current],
+                    self.absent_child[current])
+            active = active[self.feature[nodes[active]] >= 0]
+
+        return nodes
+
+    def predict_membership(self, membership):
+        return self.classes[self.leaf_class[self.apply_membership(
+            membership)]]
+
+    def predict(self, symbol_sets):
+        symbol_sets = list(symbol_sets)
+        return self.predict_membership(self.get_membership(symbol_sets))
@@ -0,0 +1,114 @@
+# @License: GPL-3.0-or-later
+# @Copyright: Copyright (C) 2021  Università degli studi di Firenze
+
+import json
+import os
+import tarfile
+
+from classes import MANIPULATION_CLASSES, SOCIAL_CLASSES
+
+
+INDEX_NAME = 'index.json'
+
+
+def is_archive(path):
+    return os.path.isfile(path) and tarfile.is_tarfile(path)
+
+
+def iter_archive(path, read_filter=None):
+    # Members are visited in a single sequential pass over the (possibly
+    # compressed) stream, so the archive never has to be seekable.
+    with tarfile.open(path, 'r|*') as archive:
+        for member in archive:
+            if not member.isfile():
+                continue
+
+            if read_filter is None or read_filter(member.name):
+                stream = archive.extractfile(member)
+                data = stream.read()
+            else:
+                data = None
+
+            yield member.name, data
+
+
+def is_index_name(member_name):
+    parts = [x for x in member_name.split('/') if x not in ('', '.')]
+    return len(parts) <= 2 and parts[-1] == INDEX_NAME
+
+
+def split_container_name(member_name):
+    parts = member_name.split('/')
+
+    if len(parts) < 3:
+        return None
+
+    social_class, manip_class, xml_name = parts[-3:]
+
+    if social_class not in SOCIAL_CLASSES or \
+            manip_class not in MANIPULATION_CLASSES:
+        return None
+
+    if '.' not in xml_name:
+        return None
+
+    return social_class, manip_class, xml_name
+
+
+def get_video_name(xml_name):
+    return xml_name[:xml_name.index('.')]
+
+
+def iter_containers(path):
+    # (name, data) of every container XML in a directory tree, in sorted
+    # order, or in an archive, in archive order.
+    if is_archive(path):
+        for member_name, data in iter_archive(path,
+                lambda x: x.endswith('.xml')):
+            if data is not None:
+                yield member_name, data
+        return
+
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            if not name.endswith('.xml'):
+                continue
+            file_path = os.path.join(root, name)
+            with open(file_path, 'rb') as stream:
+                data = stream.read()
+            yield os.path.relpath(file_path, path), data
+
+
+def read_containers(containers_path):
+    # (social class, manipulation class, video name, data) of every container
+    # listed in the index of a directory tree or archive, read in memory.
+    valid_videos_names = None
+    containers = []
+
+    if is_archive(containers_path):
+        members = iter_archive(containers_path)
+    else:
+        with open(os.path.join(containers_path, INDEX_NAME), 'r') as stream:
+            valid_videos_names = set(json.load(stream))
+        members = iter_containers(containers_path)
+
+    for member_name, data in members:
+        if is_index_name(member_name):
+            valid_videos_names = set(json.loads(data))
+            continue
+
+        container = split_container_name(member_name)
+        if container is None or not member_name.endswith('.xml'):
+            continue
+
+        social_class, manip_class, xml_name = container
+        containers.append((social_class, manip_class,
+            get_video_name(xml_name), data))
+
+    if valid_videos_names is None:
+        raise FileNotFoundError("{} not found in {}".format(INDEX_NAME,
+            containers_path))
+
+    return [container for container in containers
+            if container[2] in valid_videos_names]
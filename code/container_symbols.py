@@ -0,0 +1,371 @@
+# @License: GPL-3.0-or-later
+# @Copyright: Copyright (C) 2021  Università degli studi di Firenze
+
+import re
+import sys
+import xml.parsers.expat
+
+
+FINAL_NUMBER_RE = re.compile(r"-\d+$")
+
+IGNORED_SYMBOLS = set([
+    '@author', '@count', '@creationTime', '@depth', '@duration', '@entryCount',
+    '@entryCount', '@flags', '@gpscoords', '@matrix', '@modelName',
+    '@modificationTime', '@name', '@sampleCount', '@segmentDuration', '@size',
+    '@stuff', '@timescale', '@version', '@width', '@height', '@language'
+])
+
+
+def paths_iterator(xml_dict_data, keep_final_number, current_path=[]):
+    for key, value in xml_dict_data.items():
+        if isinstance(value, dict):
+            if keep_final_number:
+                filtered_key = key
+            else:
+                filtered_key = FINAL_NUMBER_RE.sub('', key)
+            for item in paths_iterator(value, keep_final_number,
+                    current_path + [filtered_key]):
+                yield item
+        else:
+            yield "/".join(current_path + [f"{key}"])
+            if key not in IGNORED_SYMBOLS:
+                yield "/".join(current_path + [f"{key}={value}"])
+
+
+class RepeatedElementError(Exception):
+    pass
+
+
+class _Element:
+    __slots__ = ('name', 'prefix', 'is_dict', 'children', 'text')
+
+    def __init__(self, name, prefix, is_dict):
+        self.name = name
+        self.prefix = prefix
+        self.is_dict = is_dict
+        self.children = None
+        self.text = None
+
+
+class SymbolExtractor:
+    # Event-driven equivalent of xmltodict.parse() followed by
+    # paths_iterator(): symbols are emitted from expat callbacks while only
+    # the chain of currently open elements is kept in memory. Sibling
+    # elements sharing the same tag become a list in xmltodict, whose repr()
+    # ends up inside the symbol; those documents raise RepeatedElementError
+    # and are handled by extract_symbols() through the reference path.
+
+    def __init__(self, keep_final_number=False):
+        self.keep_final_number = keep_final_number
+        self._keys = {}
+        self._attributes = {}
+
+    def normalize_key(self, key):
+        try:
+            return self._keys[key]
+        except KeyError:
+            if self.keep_final_number:
+                filtered_key = key
+            else:
+                filtered_key = FINAL_NUMBER_RE.sub('', key)
+            filtered_key = sys.intern(filtered_key)
+            self._keys[key] = filtered_key
+            return filtered_key
+
+    def attribute_symbol(self, prefix, name):
+        try:
+            return self._attributes[prefix, name]
+        except KeyError:
+            key = '@' + name
+            symbol = sys.intern(prefix + '/' + key)
+            if key in IGNORED_SYMBOLS:
+                entry = (symbol, None)
+            else:
+                entry = (symbol, symbol + '=')
+            self._attributes[prefix, name] = entry
+            return entry
+
+    def parse(self, data):
+        symbols = []
+        stack = []
+        append = symbols.append
+        attribute_symbol = self.attribute_symbol
+
+        def emit(prefix, key, value, ignored):
+            if prefix is not None:
+                symbol = prefix + '/' + key
+            else:
+                symbol = key
+            append(symbol)
+            if not ignored:
+                append('{}={}'.format(symbol, value))
+
+        def open_as_dict(element, parent_prefix):
+            name = self.normalize_key(element.name)
+            if parent_prefix is not None:
+                element.prefix = sys.intern(parent_prefix + '/' + name)
+            else:
+                element.prefix = name
+            element.is_dict = True
+
+        def start_element(name, attrs):
+            parent_prefix = None
+            if stack:
+                parent = stack[-1]
+                if parent.children is None:
+                    parent.children = set()
+                elif name in parent.children:
+                    raise RepeatedElementError(name)
+                parent.children.add(name)
+                if not parent.is_dict:
+                    # A child turns an attribute-less element into a dict
+                    # before anything else has been emitted for it.
+                    open_as_dict(parent,
+                            stack[-2].prefix if len(stack) > 1 else None)
+                parent_prefix = parent.prefix
+
+            element = _Element(name, None, False)
+            stack.append(element)
+
+            if attrs:
+                open_as_dict(element, parent_prefix)
+                prefix = element.prefix
+                for i in range(0, len(attrs), 2):
+                    symbol, symbol_prefix = attribute_symbol(prefix, attrs[i])
+                    append(symbol)
+                    if symbol_prefix is not None:
+                        append(symbol_prefix + attrs[i + 1])
+
+        def end_element(name):
+            element = stack.pop()
+            text = element.text
+            if text is not None:
+                text = ''.join(text).strip() or None
+
+            if element.is_dict:
+                if text is not None:
+                    emit(element.prefix, '#text', text, False)
+            else:
+                parent_prefix = stack[-1].prefix if stack else None
+                emit(parent_prefix, element.name, text,
+                        element.name in IGNORED_SYMBOLS)
+
+        def character_data(data):
+            element = stack[-1]
+            if element.text is None:
+                element.text = [data]
+            else:
+                element.text.append(data)
+
+        parser = xml.parsers.expat.ParserCreate()
+        parser.ordered_attributes = True
+        parser.buffer_text = True
+        parser.StartElementHandler = start_element
+        parser.EndElementHandler = end_element
+        parser.CharacterDataHandler = character_data
+        # Same entity handling as xmltodict.parse(disable_entities=True).
+        parser.DefaultHandler = lambda x: None
+        parser.ExternalEntityRefHandler = lambda *x: 1
+        parser.Parse(data, True)
+
+        return symbols
+
+
+def extract_symbols(data, keep_final_number=False, extractor=None):
+    if extractor is None:
+        extractor = SymbolExtractor(keep_final_number)
+    else:
+        keep_final_number = extractor.keep_final_number
+
+    try:
+        return extractor.parse(data)
+    except RepeatedElementError:
+        import xmltodict
+        xml_dict_data = xmltodict.parse(data, xml_attribs=True)
+        return list(paths_iterator(xml_dict_data, keep_final_number))
+
+
+def get_symbol_key(symbol):
+    # The path part of a symbol: element and attribute names cannot contain
+    # '=', so the first one starts the value.
+    return symbol.partition('=')[0]
+
+
+class _GuidedElement:
+    __slots__ = ('prefix', 'leaf_key', 'wants_text', 'is_dict', 'children',
+            'text')
+
+    def __init__(self, prefix, leaf_key, wants_text, is_dict):
+        self.prefix = prefix
+        self.leaf_key = leaf_key
+        self.wants_text = wants_text
+        self.is_dict = is_dict
+        self.children = None
+        self.text = None
+
+
+class GuidedSymbolExtractor(SymbolExtractor):
+    # SymbolExtractor looking for a given set of symbols only. What each
+    # element path can contribute (its wanted attributes, whether its text
+    # matters, whether any wanted symbol lies below it) is worked out once
+    # per path; elements that cannot lead to a wanted symbol are skipped
+    # together with their subtree. visit(symbol) is called as soon as each
+    # wanted symbol is found: a true return value stops the search there.
+    # The rest of the document is still read for repeated sibling elements,
+    # without emitting anything, so that RepeatedElementError is raised
+    # whether or not the search stopped.
+
+    def __init__(self, symbols, keep_final_number=False):
+        super().__init__(keep_final_number)
+        self.symbols = set(symbols)
+        self.keys = set(get_symbol_key(x) for x in self.symbols)
+        self.prefixes = set(key[:i] for key in self.keys
+                for i in range(len(key)) if key[i] == '/')
+
+        self._attribute_names = {}
+        for key in sorted(self.keys):
+            prefix, _, name = key.rpartition('/')
+            if name.startswith('@'):
+                self._attribute_names.setdefault(prefix, []).append(name[1:])
+
+        self._elements = {}
+
+    def get_element_info(self, parent_prefix, name):
+        # (prefix, leaf key, kept, wants text, wanted attributes) of an
+        # element; the element emits its own symbol under parent_prefix when
+        # it is a leaf, and symbols below its normalized prefix otherwise.
+        try:
+            return self._elements[parent_prefix, name]
+        except KeyError:
+            pass
+
+        if parent_prefix is not None:
+            prefix = parent_prefix + '/' + self.normalize_key(name)
+            leaf_key = parent_prefix + '/' + name
+        else:
+            prefix = self.normalize_key(name)
+            leaf_key = name
+
+        attributes = []
+        for attribute_name in self._attribute_names.get(prefix, ()):
+            key = prefix + '/@' + attribute_name
+            value_prefix = None
+            if '@' + attribute_name not in IGNORED_SYMBOLS:
+                value_prefix = key + '='
+            attributes.append((attribute_name, key, key in self.symbols,
+                value_prefix))
+
+        info = (prefix, leaf_key, prefix in self.prefixes or
+                leaf_key in self.keys,
+                prefix + '/#text' in self.keys or leaf_key in self.keys,
+                attributes)
+        self._elements[parent_prefix, name] = info
+        return info
+
+    def parse(self, data, visit=None):
+        found = []
+        stack = []
+        skip_depth = 0
+        stopped = False
+        symbols = self.symbols
+        keys = self.keys
+        get_element_info = self.get_element_info
+
+        def emit(symbol):
+            nonlocal stopped
+            if stopped:
+                return
+            found.append(symbol)
+            if visit is not None and visit(symbol):
+                stopped = True
+
+        def emit_item(key, value, ignored):
+            if key not in keys:
+                return
+            if key in symbols:
+                emit(key)
+            if not ignored:
+                symbol = '{}={}'.format(key, value)
+                if symbol in symbols:
+                    emit(symbol)
+
+        def start_element(name, attrs):
+            nonlocal skip_depth
+            if skip_depth:
+                skip_depth += 1
+                return
+
+            parent_prefix = None
+            if stack:
+                parent = stack[-1]
+                if parent.children is None:
+                    parent.children = set()
+                elif name in parent.children:
+                    raise RepeatedElementError(name)
+                parent.children.add(name)
+                parent.is_dict = True
+                parent_prefix = parent.prefix
+
+            prefix, leaf_key, kept, wants_text, attributes = \
+                    get_element_info(parent_prefix, name)
+            if not kept:
+                skip_depth = 1
+                return
+
+            stack.append(_GuidedElement(prefix, leaf_key, wants_text,
+                bool(attrs)))
+            if stopped:
+                return
+
+            for attribute_name, key, wanted, value_prefix in attributes:
+                value = attrs.get(attribute_name)
+                if value is None:
+                    continue
+                if wanted:
+                    emit(key)
+                if value_prefix is not None and \
+                        value_prefix + value in symbols:
+                    emit(value_prefix + value)
+
+        def end_element(name):
+            nonlocal skip_depth
+            if skip_depth:
+                skip_depth -= 1
+                return
+
+            element = stack.pop()
+            if stopped or not element.wants_text:
+                return
+
+            text = element.text
+            if text is not None:
+                text = ''.join(text).strip() or None
+
+            if element.is_dict:
+                if text is not None:
+                    emit_item(element.prefix + '/#text', text, False)
+            else:
+                emit_item(element.leaf_key, text,
+                        name in IGNORED_SYMBOLS)
+
+        def character_data(data):
+            if skip_depth or stopped:
+                return
+            element = stack[-1]
+            if not element.wants_text:
+                return
+            if element.text is None:
+                element.text = [data]
+            else:
+                element.text.append(data)
+
+        parser = xml.parsers.expat.ParserCreate()
+        parser.buffer_text = True
+        parser.StartElementHandler = start_element
+        parser.EndElementHandler = end_element
+        parser.CharacterDataHandler = character_data
+        parser.DefaultHandler = lambda x: None
+        parser.ExternalEntityRefHandler = lambda *x: 1
+        parser.Parse(data, True)
+
+        return found
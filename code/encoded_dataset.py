@@ -0,0 +1,329 @@
+# @License: GPL-3.0-or-later
+# @Copyright: Copyright (C) 2021  Università degli studi di Firenze
+
+import os
+
+import numpy as np
+import scipy.sparse
+
+
+FORMAT_VERSION = 1
+
+# XML documents cannot contain NUL characters, so it can safely separate the
+# symbols in the serialized vocabulary.
+SYMBOLS_SEPARATOR = '\0'
+
+
+STORE_ARRAYS = ('indptr', 'indices', 'data', 'social', 'manipulation',
+        'device')
+
+STORE_NAMES = ('symbols', 'social_classes', 'manip_classes', 'device_ids')
+
+
+def encode_names(names):
+    return np.frombuffer(SYMBOLS_SEPARATOR.join(names).encode('utf-8'),
+            dtype=np.uint8)
+
+
+def decode_names(data):
+    if len(data) == 0:
+        return []
+    return bytes(data).decode('utf-8').split(SYMBOLS_SEPARATOR)
+
+
+class EncodedDataset:
+    # The dataset as a video x symbol incidence matrix in CSR form over one
+    # sorted vocabulary. Each video only keeps the sorted ids of its distinct
+    # symbols (every consumer works on set(sequence)), and rows are ordered by
+    # social class, manipulation class and device, so every group of the
+    # nested dataset is a contiguous range of rows.
+
+    def __init__(self, symbols, indptr, indices, social, manipulation, device,
+            social_classes, manip_classes, device_ids, data=None):
+        self.symbols = symbols
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.social = social
+        self.manipulation = manipulation
+        self.device = device
+        self.social_classes = social_classes
+        self.manip_classes = manip_classes
+        self.device_ids = device_ids
+
+        self._nonzero_rows = None
+        self._group_keys = (social.astype(np.int64) * len(manip_classes) +
+                manipulation) * len(device_ids) + device
+
+    @classmethod
+    def from_nested(cls, sequences):
+        social_classes = list(sequences.keys())
+        manip_classes = []
+        device_ids = set()
+        all_symbols = set()
+
+        for social_sequences in sequences.values():
+            for manip_class, manip_sequences in social_sequences.items():
+                if manip_class not in manip_classes:
+                    manip_classes.append(manip_class)
+
+                for device_id, device_sequences in manip_sequences.items():
+                    device_ids.add(device_id)
+
+                    for sequence in device_sequences:
+                        all_symbols.update(sequence)
+
+        symbols = sorted(all_symbols)
+        device_ids = sorted(device_ids)
+        symbol_ids = {sym: i for i, sym in enumerate(symbols)}
+
+        indptr = [0]
+        indices = []
+        labels = []
+
+        for social_idx, social_class in enumerate(social_classes):
+            for manip_idx, manip_class in enumerate(manip_classes):
+                manip_sequences = sequences[social_class].get(manip_class, {})
+
+                for device_idx, device_id in enumerate(device_ids):
+                    for sequence in manip_sequences.get(device_id, []):
+                        indices.extend(sorted(set(symbol_ids[sym]
+                            for sym in sequence)))
+                        indptr.append(len(indices))
+                        labels.append((social_idx, manip_idx, device_idx))
+
+        labels = np.array(labels, dtype=np.int16).reshape(-1, 3)
+
+        return cls(symbols, np.array(indptr, dtype=np.int64),
+                np.array(indices, dtype=np.int32),
+                labels[:, 0].copy(), labels[:, 1].copy(), labels[:, 2].copy(),
+                social_classes, manip_classes, device_ids)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            if int(data['version']) != FORMAT_VERSION:
+                raise ValueError("Unsupported dataset format version {}"
+                        .format(int(data['version'])))
+
+            return cls(decode_names(data['symbols']), data['indptr'],
+                    data['indices'], data['social'], data['manipulation'],
+                    data['device'], decode_names(data['social_classes']),
+                    decode_names(data['manip_classes']),
+                    decode_names(data['device_ids']))
+
+    def save(self, path):
+        with open(path, 'wb') as stream:
+            np.savez(stream, version=np.array(FORMAT_VERSION),
+                    symbols=encode_names(self.symbols),
+                    indptr=self.indptr, indices=self.indices,
+                    social=self.social, manipulation=self.manipulation,
+                    device=self.device,
+                    social_classes=encode_names(self.social_classes),
+                    manip_classes=encode_names(self.manip_classes),
+                    device_ids=encode_names(self.device_ids))
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        # arrays maps every name in STORE_ARRAYS to its array and every name
+        # in STORE_NAMES to its encode_names() form, as in a store.
+        names = {name: decode_names(arrays[name]) for name in STORE_NAMES}
+
+        return cls(names['symbols'], arrays['indptr'], arrays['indices'],
+                arrays['social'], arrays['manipulation'], arrays['device'],
+                names['social_classes'], names['manip_classes'],
+                names['device_ids'], arrays['data'])
+
+    def to_arrays(self):
+        arrays = {}
+
+        for name in STORE_ARRAYS:
+            if name == 'data':
+                arrays[name] = self.get_data()
+            else:
+                arrays[name] = getattr(self, name)
+
+        for name in STORE_NAMES:
+            arrays[name] = encode_names(getattr(self, name))
+
+        return arrays
+
+    @classmethod
+    def open_store(cls, path):
+        # Every array is memory-mapped read-only, so processes opening the
+        # same store share its pages through the page cache.
+        version = np.load(os.path.join(path, 'version.npy'))
+        if int(version) != FORMAT_VERSION:
+            raise ValueError("Unsupported dataset format version {}".format(
+                int(version)))
+
+        return cls.from_arrays({name: np.load(os.path.join(path,
+            name + '.npy'), mmap_mode='r')
+            for name in STORE_ARRAYS + STORE_NAMES})
+
+    def save_store(self, path):
+        os.makedirs(path, exist_ok=True)
+
+        np.save(os.path.join(path, 'version.npy'), np.array(FORMAT_VERSION))
+
+        for name, array in self.to_arrays().items():
+            np.save(os.path.join(path, name + '.npy'), array)
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    def get_rows_mask(self, filter_socials=None, filter_manipulations=None,
+            filter_devices=None):
+        mask = np.ones(len(self), dtype=bool)
+
+        for names, column, name_filter in (
+                (self.social_classes, self.social, filter_socials),
+                (self.manip_classes, self.manipulation, filter_manipulations),
+                (self.device_ids, self.device, filter_devices)):
+            if name_filter is not None:
+                accepted = np.array([name_filter(x) for x in names],
+                        dtype=bool)
+                mask &= accepted[column]
+
+        return mask
+
+    def get_data(self):
+        if self.data is None:
+            self.data = np.ones(len(self.indices), dtype=np.uint8)
+        return self.data
+
+    def get_matrix(self, start=0, stop=None):
+        # Binary incidence matrix of a contiguous range of rows. indices and
+        # data are views of the underlying (possibly memory-mapped) arrays;
+        # only the small indptr slice is rebased.
+        if stop is None:
+            stop = len(self)
+
+        offset = self.indptr[start]
+        end = self.indptr[stop]
+        indptr = np.asarray(self.indptr[start:stop + 1]) - offset
+
+        return scipy.sparse.csr_matrix((self.get_data()[offset:end],
+            self.indices[offset:end], indptr),
+            shape=(stop - start, len(self.symbols)), copy=False)
+
+    def get_nonzero_rows(self):
+        if self._nonzero_rows is None:
+            self._nonzero_rows = np.repeat(
+                    np.arange(len(self), dtype=np.int32),
+                    np.diff(self.indptr))
+        return self._nonzero_rows
+
+    def get_symbol_ids(self, rows_mask=None):
+        if rows_mask is None:
+            indices = self.indices
+        else:
+            indices = self.indices[rows_mask[self.get_nonzero_rows()]]
+
+        used = np.zeros(len(self.symbols), dtype=bool)
+        used[indices] = True
+
+        return np.flatnonzero(used)
+
+    def get_group_keys(self):
+        return self._group_keys
+
+    def get_group_rows(self, social_idx, manip_idx, device_idx):
+        key = (social_idx * len(self.manip_classes) + manip_idx) * \
+                len(self.device_ids) + device_idx
+        start = np.searchsorted(self._group_keys, key, 'left')
+        stop = np.searchsorted(self._group_keys, key, 'right')
+
+        return range(start, stop)
+
+    def get_sequence(self, row):
+        symbols = self.symbols
+        return [symbols[i] for i in
+                self.indices[self.indptr[row]:self.indptr[row + 1]]]
+
+    # Read-only mapping interface mirroring the nested
+    # dataset[social][manip][device] -> list of sequences layout, decoding
+    # sequences only when they are accessed.
+
+    def keys(self):
+        return list(self.social_classes)
+
+    def items(self):
+        for social_class in self.social_classes:
+            yield social_class, self[social_class]
+
+    def values(self):
+        for social_class in self.social_classes:
+            yield self[social_class]
+
+    def __iter__(self):
+        return iter(self.social_classes)
+
+    def __getitem__(self, social_class):
+        return _SocialView(self, self.social_classes.index(social_class))
+
+
+class _SocialView:
+    def __init__(self, dataset, social_idx):
+        self.dataset = dataset
+        self.social_idx = social_idx
+
+    def keys(self):
+        return list(self.dataset.manip_classes)
+
+    def items(self):
+        for manip_class in self.dataset.manip_classes:
+            yield manip_class, self[manip_class]
+
+    def values(self):
+        for manip_class in self.dataset.manip_classes:
+            yield self[manip_class]
+
+    def __iter__(self):
+        return iter(self.dataset.manip_classes)
+
+    def __getitem__(self, manip_class):
+        return _ManipulationView(self.dataset, self.social_idx,
+                self.dataset.manip_classes.index(manip_class))
+
+
+class _ManipulationView:
+    def __init__(self, dataset, social_idx, manip_idx):
+        self.dataset = dataset
+        self.social_idx = social_idx
+        self.manip_idx = manip_idx
+
+    def keys(self):
+        return list(self.dataset.device_ids)
+
+    def items(self):
+        for device_id in self.dataset.device_ids:
+            yield device_id, self[device_id]
+
+    def values(self):
+        for device_id in self.dataset.device_ids:
+            yield self[device_id]
+
+    def __iter__(self):
+        return iter(self.dataset.device_ids)
+
+    def __getitem__(self, device_id):
+        return _SequencesView(self.dataset, self.dataset.get_group_rows(
+            self.social_idx, self.manip_idx,
+            self.dataset.device_ids.index(device_id)))
+
+
+class _SequencesView:
+    def __init__(self, dataset, rows):
+        self.dataset = dataset
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        for row in self.rows:
+            yield self.dataset.get_sequence(row)
+
+    def __getitem__(self, i):
+        return self.dataset.get_sequence(self.rows[i])
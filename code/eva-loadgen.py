@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# @License: GPL-3.0-or-later
+# @Copyright: Copyright (C) 2021  Università degli studi di Firenze
+
+import argparse
+import asyncio
+import itertools
+import json
+import time
+
+import numpy as np
+
+from container_archive import iter_containers
+
+
+def get_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--unix-socket', type=str, default=None)
+    parser.add_argument('--concurrency', type=int, default=16,
+            help='connections sending requests at the same time')
+    parser.add_argument('--requests', type=int, default=None,
+            help='requests to send, cycling over the containers (default: '
+            'each container once)')
+    parser.add_argument('--output-path', type=str, default=None,
+            help='write the predictions as JSONL')
+    parser.add_argument('containers_path',
+            help='directory or tar archive of container XMLs')
+
+    return parser
+
+
+async def open_connection(args):
+    if args.unix_socket is not None:
+        return await asyncio.open_unix_connection(args.unix_socket)
+    return await asyncio.open_connection(args.host, args.port)
+
+
+async def send_request(reader, writer, method, path, body=b''):
+    writer.write('{} {} HTTP/1.1\r\nHost: eva\r\nContent-Length: {}\r\n\r\n'
+            .format(method, path, len(body)).encode('latin-1') + body)
+    await writer.drain()
+
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    payload = await reader.readexactly(int(headers['content-length']))
+    return status, json.loads(payload)
+
+
+async def run_client(args, requests, records, latencies):
+    reader, writer = await open_connection(args)
+    try:
+        for name, data in requests:
+            start = time.perf_counter()
+            status, result = await send_request(reader, writer, 'POST',
+                    '/predict', data)
+            latencies.append(time.perf_counter() - start)
+            result['video'] = name
+            records.append(result)
+    finally:
+        writer.close()
+
+
+async def run(args):
+    containers = list(iter_containers(args.containers_path))
+    n_requests = args.requests if args.requests is not None \
+            else len(containers)
+    # One shared iterator: every client takes the next request when it is
+    # done with the previous one.
+    requests = itertools.islice(itertools.cycle(containers), n_requests)
+
+    records = []
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*[run_client(args, requests, records, latencies)
+        for _ in range(args.concurrency)])
+    elapsed = time.perf_counter() - start
+
+    reader, writer = await open_connection(args)
+    _, metrics = await send_request(reader, writer, 'GET', '/metrics')
+    writer.close()
+
+    if args.output_path is not None:
+        with open(args.output_path, 'w') as stream:
+            for record in records:
+                stream.write(json.dumps(record) + '\n')
+
+    latencies = np.array(latencies) * 1000
+    print("{} requests ({} errors) in {:.2f} s: {:.1f} requests/s".format(
+        len(records), sum('error' in x for x in records), elapsed,
+        len(records) / elapsed))
+    print("Client latency: p50 {:.2f} ms, p99 {:.2f} ms".format(
+        *np.percentile(latencies, [50, 99])))
+    print("Server metrics: {}".format(json.dumps(metrics)))
+
+
+def main(args):
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    parser = get_parser()
+    args = parser.parse_args()
+    main(args)
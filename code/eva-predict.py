@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+# @License: GPL-3.0-or-later
+# @Copyright: Copyright (C) 2021  Università degli studi di Firenze
+
+import argparse
+import collections
+import json
+import multiprocessing
+import sys
+import time
+import xml.parsers.expat
+
+import numpy as np
+
+from container_archive import iter_containers
+from container_symbols import GuidedSymbolExtractor, SymbolExtractor, \
+        extract_symbols
+from model_bundle import ModelBundle
+
+
+def get_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--chunk-size', type=int, default=32)
+    parser.add_argument('--max-pending', type=int, default=None,
+            help='chunks in flight at a time (default: 2 per worker)')
+    parser.add_argument('--lazy', action='store_true',
+            help='parse only the parts of each container the models test')
+    parser.add_argument('--classifier-path', type=str, default=None,
+            help='cascade: bundle classifying the videos that model_path '
+            '(a tampering detector) flags as tampered')
+    parser.add_argument('model_path', help='bundle from 8-export-model.py')
+    parser.add_argument('containers_path',
+            help='directory or tar archive of container XMLs')
+    parser.add_argument('output_path', help='JSONL output, - for stdout')
+
+    return parser
+
+
+def is_detector(class_names):
+    # Native and Tampered classes, with or without the OS, as written by
+    # 3-train_tampering_detector.py.
+    return all(name.endswith(('Native', 'Tampered'))
+            for name in class_names) and \
+            any(name.endswith('Native') for name in class_names) and \
+            any(name.endswith('Tampered') for name in class_names)
+
+
+def load_bundles(model_path, classifier_path=None):
+    # The model and the classifier of the cascade (None without one);
+    # ValueError if the two cannot form a cascade.
+    detector = ModelBundle.load(model_path)
+    if classifier_path is None:
+        return detector, None
+
+    if not is_detector(detector.class_names):
+        raise ValueError("The cascade needs a tampering detector as model, "
+                "{} has classes {}".format(model_path,
+                    ', '.join(detector.class_names)))
+
+    classifier = ModelBundle.load(classifier_path)
+    if classifier.keep_final_number != detector.keep_final_number:
+        raise ValueError("{} and {} were exported with different "
+                "--keep-final-number".format(model_path, classifier_path))
+
+    return detector, classifier
+
+
+class Predictor:
+    # Classes of chunks of container XMLs. By default symbols are extracted
+    # in full exactly as by 1-create_dataset.py, keeping final numbers if
+    # the bundles say so; with lazy the tree-guided parser only reads what
+    # the models test.
+    #
+    # With a classifier the models form a cascade: each video is encoded
+    # once over the union of the symbols of both trees, the detector is
+    # evaluated on the whole chunk and the classifier only on the videos
+    # whose detector class is tampered; the others exit early.
+
+    def __init__(self, detector, classifier=None, lazy=False):
+        self.detector = detector
+        self.classifier = classifier
+        bundles = [detector]
+        if classifier is not None:
+            bundles.append(classifier)
+
+        self.symbols = sorted(set(sym for bundle in bundles
+            for sym in bundle.tree.symbols))
+        self.symbol_ids = {sym: i for i, sym in enumerate(self.symbols)}
+        self.columns = [np.array([self.symbol_ids[sym]
+            for sym in bundle.tree.symbols], dtype=np.int64)
+            for bundle in bundles]
+        self.tampered = np.array([name.endswith('Tampered')
+            for name in self.detector.class_names])
+
+        keep_final_number = self.detector.keep_final_number
+        self.keep_final_number = keep_final_number
+        if lazy:
+            self.extractor = GuidedSymbolExtractor(self.symbols,
+                    keep_final_number)
+        else:
+            self.extractor = SymbolExtractor(keep_final_number)
+
+    def predict_chunk(self, chunk):
+        # Returns the records of the chunk and the seconds spent in each
+        # stage.
+        timings = collections.Counter()
+
+        start = time.perf_counter()
+        symbol_ids = self.symbol_ids
+        records = []
+        valid = []
+        membership = np.zeros((len(chunk), len(self.symbols)), dtype=bool)
+        for name, data in chunk:
+            try:
+                symbols = extract_symbols(data, self.keep_final_number,
+                        self.extractor)
+            except xml.parsers.expat.ExpatError as e:
+                records.append({'video': name, 'error': str(e)})
+                continue
+
+            membership[len(valid), [symbol_ids[sym] for sym in symbols
+                if sym in symbol_ids]] = True
+            records.append({'video': name})
+            valid.append(records[-1])
+
+        membership = membership[:len(valid)]
+        timings['extraction'] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        labels = self.detector.tree.predict_membership(
+                membership[:, self.columns[0]])
+        timings['detector'] += time.perf_counter() - start
+
+        for record, label in zip(valid, labels.tolist()):
+            record['class'] = self.detector.get_class_name(label)
+            record['label'] = label
+
+        if self.classifier is None:
+            return records, timings
+
+        start = time.perf_counter()
+        flagged = np.flatnonzero(self.tampered[labels])
+        labels = self.classifier.tree.predict_membership(
+                membership[np.ix_(flagged, self.columns[1])])
+        timings['classifier'] += time.perf_counter() - start
+
+        for record in valid:
+            record['detector'] = record['class']
+            record['classifier'] = None
+        for i, label in zip(flagged.tolist(), labels.tolist()):
+            record = valid[i]
+            record['classifier'] = self.classifier.get_class_name(label)
+            record['classifier_label'] = label
+            record['class'] = '{}/{}'.format(record['detector'],
+                    record['classifier'])
+
+        return records, timings
+
+
+_worker_predictor = None
+
+
+def init_worker(detector, classifier, lazy):
+    global _worker_predictor
+    _worker_predictor = Predictor(detector, classifier, lazy)
+
+
+def predict_chunk(chunk):
+    return _worker_predictor.predict_chunk(chunk)
+
+
+def iter_chunks(items, chunk_size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def predict_all(args, detector, classifier, containers):
+    # Yields (records, timings) of each chunk in input order. With workers,
+    # at most max_pending chunks are read ahead of the output, so memory
+    # stays bounded however large the input is.
+    if args.workers <= 1:
+        predictor = Predictor(detector, classifier, args.lazy)
+        for chunk in iter_chunks(containers, args.chunk_size):
+            yield predictor.predict_chunk(chunk)
+        return
+
+    max_pending = args.max_pending or 2 * args.workers
+    pending = collections.deque()
+
+    with multiprocessing.Pool(args.workers, initializer=init_worker,
+            initargs=(detector, classifier, args.lazy)) as pool:
+        for chunk in iter_chunks(containers, args.chunk_size):
+            if len(pending) >= max_pending:
+                yield pending.popleft().get()
+            pending.append(pool.apply_async(predict_chunk, (chunk,)))
+
+        while pending:
+            yield pending.popleft().get()
+
+
+def main(args):
+    # Loaded before the output is opened and the workers are started, so
+    # that a bad model is reported without leaving an empty output behind.
+    try:
+        detector, classifier = load_bundles(args.model_path,
+                args.classifier_path)
+    except (OSError, KeyError, ValueError) as e:
+        sys.exit("Cannot load the models: {}".format(e))
+
+    if args.output_path == '-':
+        stream = sys.stdout
+    else:
+        stream = open(args.output_path, 'w')
+
+    n_videos = 0
+    n_errors = 0
+    n_flagged = 0
+    timings = collections.Counter()
+    start = time.perf_counter()
+
+    try:
+        for records, chunk_timings in predict_all(args, detector,
+                classifier, iter_containers(args.containers_path)):
+            timings.update(chunk_timings)
+            for record in records:
+                stream.write(json.dumps(record) + '\n')
+                n_videos += 1
+                n_errors += 'error' in record
+                n_flagged += record.get('classifier') is not None
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+
+    elapsed = time.perf_counter() - start
+    print("{} videos ({} errors) in {:.2f} s: {:.1f} videos/s".format(
+        n_videos, n_errors, elapsed, n_videos / elapsed if elapsed > 0 else 0),
+        file=sys.stderr)
+    # Stage times are summed over the workers.
+    print("Stages: {}".format(', '.join('{} {:.3f} ms/video'.format(name,
+        1000 * timings[name] / max(n_videos, 1))
+        for name in ['extraction', 'detector', 'classifier']
+        if name in timings)), file=sys.stderr)
+    if args.classifier_path is not None:
+        n_valid = n_videos - n_errors
+        print("Early exit: {} of {} videos ({:.1%})".format(
+            n_valid - n_flagged, n_valid,
+            (n_valid - n_flagged) / n_valid if n_valid > 0 else 0),
+            file=sys.stderr)
+
+
+if __name__ == '__main__':
+    parser = get_parser()
+    args = parser.parse_args()
+    main(args)
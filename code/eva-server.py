@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+# @License: GPL-3.0-or-later
+# @Copyright: Copyright (C) 2021  Università degli studi di Firenze
+
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import json
+import signal
+import time
+import xml.parsers.expat
+
+import numpy as np
+
+from container_symbols import GuidedSymbolExtractor, RepeatedElementError, \
+        SymbolExtractor, extract_symbols
+from model_bundle import ModelBundle
+
+
+LATENCY_WINDOW = 10000
+
+HTTP_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found',
+        405: 'Method Not Allowed', 413: 'Payload Too Large',
+        500: 'Internal Server Error'}
+
+
+def get_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--unix-socket', type=str, default=None,
+            help='listen on this Unix socket instead of host:port')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--max-batch-size', type=int, default=64)
+    parser.add_argument('--max-wait-ms', type=float, default=2.0)
+    parser.add_argument('--max-body-size', type=int, default=64,
+            help='largest accepted request body, in MB')
+    parser.add_argument('--lazy', action='store_true',
+            help='parse only the parts of each container the model tests')
+    parser.add_argument('model_path', help='bundle from 8-export-model.py')
+
+    return parser
+
+
+_worker_symbols = None
+_worker_extractor = None
+_worker_keep_final_number = None
+
+
+def init_worker(model_path, lazy):
+    global _worker_symbols, _worker_extractor, _worker_keep_final_number
+
+    bundle = ModelBundle.load(model_path)
+    symbols = bundle.tree.symbols
+    keep_final_number = bundle.keep_final_number
+    _worker_symbols = {sym: i for i, sym in enumerate(symbols)}
+    _worker_keep_final_number = keep_final_number
+    if lazy:
+        _worker_extractor = GuidedSymbolExtractor(symbols, keep_final_number)
+    else:
+        _worker_extractor = SymbolExtractor(keep_final_number)
+
+
+def get_symbol_ids(data):
+    # Ids of the tree symbols found in a container, or (None, error message)
+    # for documents that cannot be parsed.
+    try:
+        try:
+            symbols = _worker_extractor.parse(data)
+        except RepeatedElementError:
+            symbols = extract_symbols(data, _worker_keep_final_number)
+    except xml.parsers.expat.ExpatError as e:
+        return None, str(e)
+
+    return sorted(set(_worker_symbols[sym] for sym in symbols
+        if sym in _worker_symbols)), None
+
+
+def get_content_length(headers):
+    # Body size of a request, or None if Content-Length is not a valid one.
+    try:
+        length = int(headers.get('content-length', 0))
+    except ValueError:
+        return None
+    return length if length >= 0 else None
+
+
+class InferenceServer:
+    # Containers are parsed by a process pool, off the event loop; parsed
+    # requests wait in a queue, from which batches of up to max_batch_size
+    # requests (waiting at most max_wait seconds for a batch to fill) are
+    # evaluated at once with CompiledTree.predict_membership().
+
+    def __init__(self, bundle, executor, max_batch_size, max_wait,
+            max_body_size):
+        self.bundle = bundle
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_body_size = max_body_size
+        self.queue = asyncio.Queue()
+        self.parsing = 0
+        self.latencies = collections.deque(maxlen=LATENCY_WINDOW)
+        self.n_requests = 0
+        self.n_errors = 0
+        self.n_batches = 0
+        self.n_batched = 0
+
+    async def predict(self, data):
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+
+        self.parsing += 1
+        try:
+            symbol_ids, error = await loop.run_in_executor(self.executor,
+                    get_symbol_ids, data)
+        finally:
+            self.parsing -= 1
+
+        if error is not None:
+            self.n_errors += 1
+            return 400, {'error': error}
+
+        future = loop.create_future()
+        await self.queue.put((symbol_ids, future))
+        label = await future
+
+        self.n_requests += 1
+        self.latencies.append(time.perf_counter() - start)
+
+        return 200, {'class': self.bundle.get_class_name(label),
+                'label': label}
+
+    async def get_batch(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(),
+                    timeout))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def run_batches(self):
+        tree = self.bundle.tree
+
+        while True:
+            batch = await self.get_batch()
+
+            # A failed batch fails its own requests only: the loop keeps
+            # serving the next ones.
+            try:
+                membership = np.zeros((len(batch), len(tree.symbols)),
+                        dtype=bool)
+                for row, (symbol_ids, future) in enumerate(batch):
+                    membership[row, symbol_ids] = True
+
+                labels = tree.predict_membership(membership).tolist()
+            except Exception as e:
+                for symbol_ids, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (symbol_ids, future), label in zip(batch, labels):
+                if not future.done():
+                    future.set_result(int(label))
+
+            self.n_batches += 1
+            self.n_batched += len(batch)
+
+    def get_metrics(self):
+        latencies = np.array(self.latencies) * 1000
+        if len(latencies) > 0:
+            p50, p99 = np.percentile(latencies, [50, 99]).tolist()
+        else:
+            p50 = p99 = None
+
+        return {
+            'requests': self.n_requests,
+            'errors': self.n_errors,
+            'latency_p50_ms': p50,
+            'latency_p99_ms': p99,
+            'parsing': self.parsing,
+            'queue_depth': self.queue.qsize(),
+            'batches': self.n_batches,
+            'mean_batch_size': self.n_batched / self.n_batches
+                if self.n_batches > 0 else None,
+        }
+
+    async def handle_request(self, method, path, body):
+        if path == '/predict':
+            if method != 'POST':
+                return 405, {'error': 'use POST'}
+            try:
+                return await self.predict(body)
+            except Exception as e:
+                # The worker pool or the batch failed, not the request.
+                self.n_errors += 1
+                return 500, {'error': '{}: {}'.format(type(e).__name__, e)}
+        elif path == '/metrics':
+            return 200, self.get_metrics()
+        else:
+            return 404, {'error': 'unknown path {}'.format(path)}
+
+    async def handle_connection(self, reader, writer):
+        # Minimal HTTP/1.1: one request at a time per connection, bodies
+        # sized by Content-Length, connections kept alive unless the client
+        # asks otherwise.
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+
+                request = request_line.decode('latin-1').split(' ', 2)
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                keep_alive = headers.get('connection', '').lower() != 'close'
+
+                # The bodies of malformed and too large requests are not
+                # read: the connection is closed after the reply.
+                length = get_content_length(headers)
+                status = None
+                if len(request) != 3:
+                    status, result = 400, {'error': 'malformed request '
+                            'line'}
+                elif length is None:
+                    status, result = 400, {'error': 'invalid Content-Length '
+                            '{!r}'.format(headers['content-length'])}
+                elif length > self.max_body_size:
+                    status, result = 413, {'error': 'body larger than {} '
+                            'bytes'.format(self.max_body_size)}
+
+                if status is None:
+                    method, path, _ = request
+                    body = await reader.readexactly(length)
+                    status, result = await self.handle_request(method, path,
+                            body)
+                else:
+                    self.n_errors += 1
+                    keep_alive = False
+
+                payload = json.dumps(result).encode('utf-8')
+
+                writer.write('HTTP/1.1 {} {}\r\nContent-Type: '
+                        'application/json\r\nContent-Length: {}\r\n'
+                        'Connection: {}\r\n\r\n'.format(status,
+                            HTTP_REASONS[status], len(payload),
+                            'keep-alive' if keep_alive else 'close')
+                        .encode('latin-1') + payload)
+                await writer.drain()
+
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(args):
+    bundle = ModelBundle.load(args.model_path)
+
+    with concurrent.futures.ProcessPoolExecutor(args.workers,
+            initializer=init_worker, initargs=(args.model_path,
+                args.lazy)) as executor:
+        server = InferenceServer(bundle, executor, args.max_batch_size,
+                args.max_wait_ms / 1000, args.max_body_size * 1024 * 1024)
+        batches = asyncio.ensure_future(server.run_batches())
+
+        if args.unix_socket is not None:
+            listener = await asyncio.start_unix_server(
+                    server.handle_connection, args.unix_socket)
+            print("Listening on {}".format(args.unix_socket), flush=True)
+        else:
+            listener = await asyncio.start_server(server.handle_connection,
+                    args.host, args.port)
+            print("Listening on {}:{}".format(args.host, args.port),
+                    flush=True)
+
+        # Runs until SIGINT or SIGTERM, then stops accepting connections.
+        loop = asyncio.get_running_loop()
+        stopped = loop.create_future()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, lambda: stopped.done() or
+                    stopped.set_result(None))
+
+        try:
+            async with listener:
+                await stopped
+        finally:
+            batches.cancel()
+
+        print("Stopped: {}".format(json.dumps(server.get_metrics())),
+                flush=True)
+
+
+def main(args):
+    asyncio.run(serve(args))
+
+
+if __name__ == '__main__':
+    parser = get_parser()
+    args = parser.parse_args()
+    main(args)
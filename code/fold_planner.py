@@ -0,0 +1,251 @@
+# @License: GPL-3.0-or-later
+# @Copyright: Copyright (C) 2021  Università degli studi di Firenze
+
+import collections
+import hashlib
+import multiprocessing
+import threading
+
+import joblib
+import numpy as np
+import scipy.sparse
+
+from common_defs import get_classifier
+from encoded_dataset import EncodedDataset
+from shared_arrays import SharedArrays, attach_arrays
+
+
+class FoldPlanner:
+    # Leave-one-device-out folds over a dataset encoded once against its
+    # global (sorted) vocabulary. A fold is a row mask (the held out device)
+    # and a column mask (the chosen symbols, kept in vocabulary order), so
+    # each fold sees the same features in the same order as encoding every
+    # video again with get_videos_data().
+
+    def __init__(self, dataset, cache_size=0):
+        # cache_size bounds (in bytes) the fold matrices kept for reuse: runs
+        # sharing a planner that differ only in their labels (e.g. with and
+        # without OS classes) then encode each fold once. The planner can be
+        # shared by threads.
+        if not isinstance(dataset, EncodedDataset):
+            dataset = EncodedDataset.from_nested(dataset)
+
+        self.dataset = dataset
+        self.cache_size = cache_size
+        self._symbol_ids = None
+        self._device_counts = None
+        self._fold_symbols = {}
+        self._matrices = collections.OrderedDict()
+        self._matrices_size = 0
+        self._lock = threading.Lock()
+
+    def get_device_counts(self):
+        if self._device_counts is None:
+            dataset = self.dataset
+            devices = scipy.sparse.csr_matrix(
+                    (np.ones(len(dataset), dtype=np.int32),
+                        (dataset.device, np.arange(len(dataset)))),
+                    shape=(len(dataset.device_ids), len(dataset)))
+            self._device_counts = (devices @
+                    dataset.get_matrix().astype(np.int32)).toarray()
+        return self._device_counts
+
+    def get_labels(self, get_class):
+        # get_class(social_class, manip_class, device_id) returns the label of
+        # the videos of a non-empty group, or None to leave them out of every
+        # fold.
+        dataset = self.dataset
+        keys, inverse = np.unique(dataset.get_group_keys(),
+                return_inverse=True)
+        labels = np.full(len(keys), -1, dtype=np.int64)
+
+        for i, key in enumerate(keys):
+            key, device_idx = divmod(int(key), len(dataset.device_ids))
+            social_idx, manip_idx = divmod(key, len(dataset.manip_classes))
+
+            label = get_class(dataset.social_classes[social_idx],
+                    dataset.manip_classes[manip_idx],
+                    dataset.device_ids[device_idx])
+            if label is not None:
+                labels[i] = label
+
+        return labels[inverse.reshape(-1)]
+
+    def get_fold_symbols(self, test_device_id):
+        # Same as find_all_symbols(dataset,
+        #     filter_devices=lambda x: x != test_device_id).
+        if test_device_id not in self._fold_symbols:
+            device_counts = self.get_device_counts()
+            counts = device_counts.sum(axis=0)
+            if test_device_id in self.dataset.device_ids:
+                device_idx = self.dataset.device_ids.index(test_device_id)
+                counts = counts - device_counts[device_idx]
+
+            self._fold_symbols[test_device_id] = [self.dataset.symbols[i]
+                    for i in np.flatnonzero(counts > 0)]
+
+        return list(self._fold_symbols[test_device_id])
+
+    def get_columns(self, chosen_symbols):
+        if self._symbol_ids is None:
+            self._symbol_ids = {sym: i
+                    for i, sym in enumerate(self.dataset.symbols)}
+
+        return np.array([self._symbol_ids.get(sym, -1)
+            for sym in chosen_symbols], dtype=np.int64)
+
+    def get_matrix(self, rows, columns):
+        if self.cache_size <= 0:
+            return self.encode_matrix(rows, columns)
+
+        key = (hashlib.sha256(rows.tobytes()).digest(),
+                hashlib.sha256(columns.tobytes()).digest())
+
+        with self._lock:
+            result = self._matrices.get(key)
+            if result is not None:
+                self._matrices.move_to_end(key)
+                return result
+
+        result = self.encode_matrix(rows, columns)
+        result.flags.writeable = False
+
+        with self._lock:
+            if key not in self._matrices and result.nbytes <= self.cache_size:
+                self._matrices[key] = result
+                self._matrices_size += result.nbytes
+
+                while self._matrices_size > self.cache_size:
+                    _, evicted = self._matrices.popitem(last=False)
+                    self._matrices_size -= evicted.nbytes
+
+        return result
+
+    def encode_matrix(self, rows, columns):
+        # Rows of the 0/1 matrix of the given symbol ids, filled straight
+        # from the CSR arrays; ids of symbols missing from the dataset (-1)
+        # are all-zero features.
+        dataset = self.dataset
+        known = np.flatnonzero(columns >= 0)
+        lookup = np.full(len(dataset.symbols), -1, dtype=np.int64)
+        lookup[columns[known]] = known
+
+        starts = np.asarray(dataset.indptr[rows])
+        lengths = np.asarray(dataset.indptr[rows + 1]) - starts
+        offsets = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+        positions = offsets + np.arange(len(offsets))
+
+        result_rows = np.repeat(np.arange(len(rows)), lengths)
+        result_columns = lookup[dataset.indices[positions]]
+        used = result_columns >= 0
+
+        result = np.zeros((len(rows), len(columns)), dtype=np.uint8)
+        result[result_rows[used], result_columns[used]] = 1
+        return result
+
+    def get_fold(self, labels, test_device_id, columns):
+        if test_device_id in self.dataset.device_ids:
+            test_mask = self.dataset.device == \
+                    self.dataset.device_ids.index(test_device_id)
+        else:
+            test_mask = np.zeros(len(self.dataset), dtype=bool)
+
+        train_rows = np.flatnonzero((labels >= 0) & ~test_mask)
+        test_rows = np.flatnonzero((labels >= 0) & test_mask)
+
+        return (self.get_matrix(train_rows, columns), labels[train_rows],
+                self.get_matrix(test_rows, columns),
+                labels[test_rows].tolist())
+
+
+def get_task_seeds(seed, n_tasks):
+    # One seed per task, fixed by the task position: results do not depend
+    # on which worker runs a task or in which order tasks complete.
+    return [int(x) for x in
+            np.random.SeedSequence(seed).generate_state(n_tasks)]
+
+
+def fit_fold(planner, labels, task, classifier='tree', classifier_jobs=1):
+    labels_idx, test_device_id, columns, random_state = task
+
+    train_xs, train_ys, test_xs, test_ys = planner.get_fold(labels[labels_idx],
+            test_device_id, columns)
+
+    # Ensembles fit their trees on threads, which (unlike joblib's default
+    # processes) also works inside the pool workers.
+    with joblib.parallel_backend('threading', n_jobs=classifier_jobs):
+        clf = get_classifier(random_state, classifier, classifier_jobs)
+        clf.fit(train_xs, train_ys)
+
+        return clf, test_ys, clf.predict(test_xs)
+
+
+_worker_planner = None
+_worker_labels = None
+_worker_segments = None
+_worker_classifier = None
+
+
+def init_worker(spec, classifier):
+    global _worker_planner, _worker_labels, _worker_segments, \
+            _worker_classifier
+
+    arrays, _worker_segments = attach_arrays(spec)
+    _worker_planner = FoldPlanner(EncodedDataset.from_arrays(arrays))
+    _worker_labels = arrays['labels']
+    _worker_classifier = classifier
+
+
+def run_fold(task):
+    return fit_fold(_worker_planner, _worker_labels, task,
+            *_worker_classifier)
+
+
+def run_folds(planner, labels, tasks, jobs=1, fold_cache=None,
+        labels_names=None, classifier='tree', classifier_jobs=1):
+    # labels is a list of get_labels() results; each task is (index in
+    # labels, test device id, chosen symbols, classifier seed). Results come
+    # back in task order. classifier and classifier_jobs are passed to
+    # get_classifier().
+    #
+    # With a fold_cache, results are looked up with
+    # fold_cache.get(labels_names[index], test_device_id) and only the
+    # missing folds are fitted, then stored with fold_cache.put().
+    #
+    # The workers attach to one copy of the dataset and of the labels
+    # published in shared memory, so only the small per-fold arguments are
+    # pickled and the memory used does not grow with the number of workers.
+    results = [None] * len(tasks)
+
+    if fold_cache is not None:
+        for i, (labels_idx, test_device_id, _, _) in enumerate(tasks):
+            results[i] = fold_cache.get(labels_names[labels_idx],
+                    test_device_id)
+
+    missing = [i for i, result in enumerate(results) if result is None]
+    missing_tasks = [(labels_idx, test_device_id,
+        planner.get_columns(chosen_symbols), random_state)
+        for labels_idx, test_device_id, chosen_symbols, random_state in
+        (tasks[i] for i in missing)]
+
+    if jobs > 1 and len(missing_tasks) > 1:
+        arrays = planner.dataset.to_arrays()
+        arrays['labels'] = np.array(labels, dtype=np.int64).reshape(
+                len(labels), len(planner.dataset))
+
+        with SharedArrays(arrays) as shared:
+            with multiprocessing.Pool(jobs, initializer=init_worker,
+                    initargs=(shared.spec,
+                        (classifier, classifier_jobs))) as pool:
+                fitted = pool.map(run_fold, missing_tasks, chunksize=1)
+    else:
+        fitted = [fit_fold(planner, labels, task, classifier, classifier_jobs)
+                for task in missing_tasks]
+
+    for i, result in zip(missing, fitted):
+        results[i] = result
+        if fold_cache is not None:
+            labels_idx, test_device_id = tasks[i][:2]
+            fold_cache.put(labels_names[labels_idx], test_device_id, result)
+
+    return results
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# @License: GPL-3.0-or-later
+# @Copyright: Copyright (C) 2021  Università degli studi di Firenze
+
+import argparse
+import collections
+import json
+import multiprocessing
+import os
+import random
+import string
+import sys
+import xml.etree.ElementTree as ElementTree
+from xml.sax.saxutils import escape
+
+from classes import MANIPULATION_CLASSES, SOCIAL_CLASSES
+from common_defs import BRANDS_FOR_DEVICES
+from container_archive import INDEX_NAME, read_containers
+
+
+XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8"?>'
+
+ATTRIBUTE_ENTITIES = {'"': '&quot;', '\n': '&#10;', '\r': '&#13;',
+        '\t': '&#9;'}
+
+SYNTHETIC_DEVICE_PREFIX = 'S'
+
+DEVICE_ID_DIGITS = string.digits + string.ascii_uppercase
+
+# Devices with containers in the corpus (D17 has none): the devices of a
+# synthetic corpus are modeled on these.
+SOURCE_DEVICES = sorted(x for x in BRANDS_FOR_DEVICES if x != 'D17')
+
+
+def get_device_id(index):
+    # Devices of a synthetic corpus: the source devices first, then S00 to
+    # SZZ, so that ids keep their three characters (video_name[:3]).
+    if index < len(SOURCE_DEVICES):
+        return SOURCE_DEVICES[index]
+
+    high, low = divmod(index - len(SOURCE_DEVICES), len(DEVICE_ID_DIGITS))
+    if high >= len(DEVICE_ID_DIGITS):
+        raise ValueError("At most {} devices".format(len(SOURCE_DEVICES) +
+            len(DEVICE_ID_DIGITS) ** 2))
+
+    return SYNTHETIC_DEVICE_PREFIX + DEVICE_ID_DIGITS[high] + \
+            DEVICE_ID_DIGITS[low]
+
+
+def get_source_device(device_id):
+    # The real device a synthetic one is modeled on (itself for real ones):
+    # device get_device_id(i) is modeled on SOURCE_DEVICES[i % 34].
+    if device_id in BRANDS_FOR_DEVICES:
+        return device_id
+
+    if len(device_id) != 3 or \
+            not device_id.startswith(SYNTHETIC_DEVICE_PREFIX) or \
+            any(c not in DEVICE_ID_DIGITS for c in device_id[1:]):
+        raise KeyError(device_id)
+
+    index = len(SOURCE_DEVICES) + \
+            DEVICE_ID_DIGITS.index(device_id[1]) * len(DEVICE_ID_DIGITS) + \
+            DEVICE_ID_DIGITS.index(device_id[2])
+    return SOURCE_DEVICES[index % len(SOURCE_DEVICES)]
+
+
+def get_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--devices', type=int, default=len(SOURCE_DEVICES),
+            help='devices of the synthetic corpus; the first {} keep the ids '
+            'of the real ones, the others are S00-SZZ'.format(
+                len(SOURCE_DEVICES)))
+    parser.add_argument('--videos-per-device', type=int, default=4)
+    parser.add_argument('--vocabulary-growth', type=float, default=0.0,
+            help='probability that a device gets its own values of an '
+            'attribute, adding new symbols to the vocabulary')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('containers_path',
+            help='directory or tar archive of the real container XMLs')
+    parser.add_argument('output_path')
+
+    return parser
+
+
+class ContainerModel:
+    # Box trees and attribute values of the containers of each (social
+    # class, manipulation class, device) group. A synthetic container copies
+    # the box tree and attribute names of a random container of its group,
+    # and draws each attribute value from the values that attribute takes at
+    # the same path in the group.
+
+    def __init__(self):
+        self.trees = collections.defaultdict(list)
+        self.values = collections.defaultdict(list)
+        self._shapes = {}
+
+    def add(self, group, data):
+        root = ElementTree.fromstring(data)
+        self.trees[group].append(self.add_element(group, root, ''))
+
+    def add_element(self, group, element, parent_path):
+        # Returns the (tag, attribute names, children) shape of the element;
+        # equal shapes are stored once.
+        path = parent_path + '/' + element.tag
+        for name, value in element.attrib.items():
+            self.values[group, path, name].append(value)
+
+        shape = (element.tag, tuple(element.attrib),
+                tuple(self.add_element(group, child, path)
+                    for child in element))
+        return self._shapes.setdefault(shape, shape)
+
+    def get_devices(self):
+        return set(device_id for social_class, manip_class, device_id in
+                self.trees)
+
+    def get_stats(self):
+        return {'groups': len(self.trees),
+                'trees': len(set(tree for trees in self.trees.values()
+                    for tree in trees)),
+                'attributes': len(self.values)}
+
+
+class DeviceGenerator:
+    # Containers of one synthetic device, modeled on the groups of its source
+    # device. With vocabulary_growth, each attribute path is made specific to
+    # the device with that probability: its values get the device id
+    # appended, which gives new symbols.
+
+    def __init__(self, model, device_id, vocabulary_growth, seed):
+        self.model = model
+        self.device_id = device_id
+        self.source_device = get_source_device(device_id)
+        self.vocabulary_growth = vocabulary_growth
+        self.rng = random.Random('{}-{}'.format(seed, device_id))
+        self._specific = {}
+
+    def get_value(self, group, path, name):
+        value = self.rng.choice(self.model.values[group, path, name])
+
+        key = (path, name)
+        if key not in self._specific:
+            self._specific[key] = \
+                    self.rng.random() < self.vocabulary_growth
+        if self._specific[key]:
+            value = '{}-{}'.format(value, self.device_id)
+
+        return value
+
+    def write_element(self, lines, group, shape, parent_path, depth):
+        tag, names, children = shape
+        path = parent_path + '/' + tag
+
+        line = '  ' * depth + '<' + tag
+        for name in names:
+            line += ' {}="{}"'.format(name, escape(self.get_value(group, path,
+                name), ATTRIBUTE_ENTITIES))
+
+        if not children:
+            lines.append(line + ' />')
+            return
+
+        lines.append(line + '>')
+        for child in children:
+            self.write_element(lines, group, child, path, depth + 1)
+        lines.append('  ' * depth + '</{}>'.format(tag))
+
+    def generate(self, social_class, manip_class):
+        # One container of the group, or None if the source device has no
+        # container in it.
+        group = (social_class, manip_class, self.source_device)
+        trees = self.model.trees.get(group)
+        if not trees:
+            return None
+
+        lines = [XML_DECLARATION]
+        self.write_element(lines, group, self.rng.choice(trees), '', 0)
+        return '\n'.join(lines) + '\n'
+
+
+def learn_model(containers_path):
+    model = ContainerModel()
+
+    for social_class, manip_class, video_name, data in \
+            read_containers(containers_path):
+        model.add((social_class, manip_class, video_name[:3]), data)
+
+    return model
+
+
+_worker_model = None
+_worker_args = None
+
+
+def init_worker(model, args):
+    global _worker_model, _worker_args
+    _worker_model = model
+    _worker_args = args
+
+
+def generate_device(model, args, device_idx):
+    # Writes the containers of one device; returns the names of its videos
+    # and the number of containers written.
+    device_id = get_device_id(device_idx)
+    generator = DeviceGenerator(model, device_id, args.vocabulary_growth,
+            args.seed)
+
+    video_names = []
+    n_containers = 0
+
+    for i in range(args.videos_per_device):
+        video_name = '{}_V_synthetic_{:04d}'.format(device_id, i + 1)
+        found = False
+
+        for social_class in SOCIAL_CLASSES:
+            for manip_class in MANIPULATION_CLASSES:
+                data = generator.generate(social_class, manip_class)
+                if data is None:
+                    continue
+
+                xml_path = os.path.join(args.output_path, social_class,
+                        manip_class, video_name + '.mp4.xml')
+                with open(xml_path, 'w', encoding='utf-8') as stream:
+                    stream.write(data)
+
+                found = True
+                n_containers += 1
+
+        if found:
+            video_names.append(video_name)
+
+    return video_names, n_containers
+
+
+def generate_worker_device(device_idx):
+    return generate_device(_worker_model, _worker_args, device_idx)
+
+
+def main(args):
+    model = learn_model(args.containers_path)
+    print("Learned {}".format(model.get_stats()))
+
+    missing = sorted(set(get_source_device(get_device_id(i))
+        for i in range(args.devices)) - model.get_devices())
+    if missing:
+        print("Warning: no containers of {} in {}, the devices modeled on "
+                "them are left empty".format(', '.join(missing),
+                    args.containers_path), file=sys.stderr)
+
+    for social_class in SOCIAL_CLASSES:
+        for manip_class in MANIPULATION_CLASSES:
+            os.makedirs(os.path.join(args.output_path, social_class,
+                manip_class), exist_ok=True)
+
+    video_names = []
+    n_containers = 0
+
+    if args.workers > 1:
+        with multiprocessing.Pool(args.workers, initializer=init_worker,
+                initargs=(model, args)) as pool:
+            results = list(pool.imap(generate_worker_device,
+                range(args.devices)))
+    else:
+        results = [generate_device(model, args, device_idx)
+                for device_idx in range(args.devices)]
+
+    for device_video_names, device_containers in results:
+        video_names.extend(device_video_names)
+        n_containers += device_containers
+
+    with open(os.path.join(args.output_path, INDEX_NAME), 'w') as stream:
+        json.dump(sorted(video_names), stream, indent=4)
+
+    print("Wrote {} containers of {} videos to {}".format(n_containers,
+        len(video_names), args.output_path))
+
+    n_requested = args.devices * args.videos_per_device
+    if len(video_names) < n_requested:
+        print("Warning: {} videos requested, {} written".format(n_requested,
+            len(video_names)), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    parser = get_parser()
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,46 @@
+# @License: GPL-3.0-or-later
+# @Copyright: Copyright (C) 2021  Università degli studi di Firenze
+
+from container_symbols import GuidedSymbolExtractor, RepeatedElementError, \
+        extract_symbols
+
+
+class LazyTreePredictor:
+    # Predicts the class of a container XML with a CompiledTree, parsing only
+    # the parts of the document that can contain one of the tree symbols.
+    #
+    # A symbol can always reappear later in the document (sibling boxes such
+    # as trak-1 and trak-2 share their normalized path), so a missing symbol
+    # is only known once the document is over; a found one is known at once.
+    # With stop_early, the search stops as soon as the walk from the root
+    # reaches a leaf through found symbols only. The rest of the document is
+    # still read for repeated sibling tags (which make extract_symbols() fall
+    # back to xmltodict and change the symbols of the repeated elements), so
+    # the prediction always matches the tree on extract_symbols(data).
+
+    def __init__(self, tree, keep_final_number=False):
+        self.tree = tree
+        self.keep_final_number = keep_final_number
+        self.extractor = GuidedSymbolExtractor(tree.symbols, keep_final_number)
+
+    def get_referenced_paths(self):
+        # Element paths the parser descends into.
+        return set(self.extractor.prefixes)
+
+    def predict(self, data, stop_early=True):
+        tree = self.tree
+        found = set()
+        node = 0
+
+        def visit(symbol):
+            nonlocal node
+            found.add(symbol)
+            node = tree.advance(node, found)
+            return stop_early and tree.is_leaf(node)
+
+        try:
+            self.extractor.parse(data, visit)
+        except RepeatedElementError:
+            found = set(extract_symbols(data, self.keep_final_number))
+
+        return tree.predict_one(found)
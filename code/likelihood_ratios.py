@@ -0,0 +1,228 @@
+# @License: GPL-3.0-or-later
+# @Copyright: Copyright (C) 2021  Università degli studi di Firenze
+
+import functools
+import hashlib
+import math
+import os
+import tempfile
+
+import numpy as np
+import scipy.sparse
+
+from encoded_dataset import decode_names, encode_names
+
+
+OS_CLASSES = ['Android', 'iOS']
+
+FORMAT_VERSION = 1
+
+VOCABULARY_NAME = 'symbols.npy'
+
+
+def get_log_freqs(counts, total_sequences):
+    # Same smoothing as the original per-pair implementation: every symbol
+    # starts with one occurrence and the sequence count starts at one. With n
+    # sequences a symbol count can only take n + 1 values, so log10 is
+    # evaluated once per value with math.log10 and then looked up.
+    table = np.array([math.log10((k + 1) / (total_sequences + 1))
+        for k in range(total_sequences + 1)])
+    return table[counts]
+
+
+class LikelihoodRatioEngine:
+    # Symbol counts are computed once per (social, manipulation, device)
+    # group with a sparse product; the counts of a class with one device left
+    # out are then the class totals minus that device's group.
+
+    def __init__(self, dataset, device_os=None):
+        n_social = len(dataset.social_classes)
+        n_manip = len(dataset.manip_classes)
+        n_devices = len(dataset.device_ids)
+        n_groups = n_social * n_manip * n_devices
+
+        group_keys = dataset.get_group_keys()
+        groups = scipy.sparse.csr_matrix(
+                (np.ones(len(group_keys), dtype=np.int32),
+                    (group_keys, np.arange(len(group_keys)))),
+                shape=(n_groups, len(dataset)))
+        videos = dataset.get_matrix().astype(np.int32)
+
+        group_counts = (groups @ videos).toarray()
+        group_sizes = np.bincount(group_keys, minlength=n_groups)
+
+        self.symbols = dataset.symbols
+        self.device_ids = list(dataset.device_ids)
+        self.group_counts = group_counts.reshape(n_social, n_manip, n_devices,
+                -1)
+        self.group_sizes = group_sizes.reshape(n_social, n_manip, n_devices)
+        self.device_counts = self.group_counts.sum(axis=(0, 1))
+        self.total_counts = self.device_counts.sum(axis=0)
+
+        self.classes = []
+        class_groups = []
+        members = []
+
+        for social_idx, social_class in enumerate(dataset.social_classes):
+            for manip_idx, manip_class in enumerate(dataset.manip_classes):
+                if device_os is None:
+                    self.classes.append((social_class, manip_class))
+                    class_groups.append((social_idx, manip_idx))
+                    members.append(np.ones(n_devices, dtype=bool))
+                else:
+                    for os_class in OS_CLASSES:
+                        self.classes.append((os_class, social_class,
+                            manip_class))
+                        class_groups.append((social_idx, manip_idx))
+                        members.append(np.array([x == os_class
+                            for x in device_os], dtype=bool))
+
+        self.class_groups = np.array(class_groups, dtype=np.int64)
+        self.members = np.array(members)
+
+        social_idx = self.class_groups[:, 0]
+        manip_idx = self.class_groups[:, 1]
+        self.class_counts = np.einsum('cd,cds->cs', self.members,
+                self.group_counts[social_idx, manip_idx])
+        self.class_sizes = (self.members *
+                self.group_sizes[social_idx, manip_idx]).sum(axis=1)
+
+        self.pairs = np.array([(i, j) for i in range(len(self.classes))
+            for j in range(i + 1, len(self.classes))],
+            dtype=np.int64).reshape(-1, 2)
+
+    def get_fold_counts(self, excluded_device=None):
+        if excluded_device is None:
+            return self.class_counts, self.class_sizes, self.total_counts
+
+        device_idx = self.device_ids.index(excluded_device)
+        social_idx = self.class_groups[:, 0]
+        manip_idx = self.class_groups[:, 1]
+        excluded = self.members[:, device_idx]
+
+        counts = self.class_counts - excluded[:, np.newaxis] * \
+                self.group_counts[social_idx, manip_idx, device_idx]
+        sizes = self.class_sizes - excluded * \
+                self.group_sizes[social_idx, manip_idx, device_idx]
+        total_counts = self.total_counts - self.device_counts[device_idx]
+
+        return counts, sizes, total_counts
+
+    def get_ratios(self, excluded_device=None):
+        counts, sizes, total_counts = self.get_fold_counts(excluded_device)
+
+        symbol_ids = np.flatnonzero(total_counts > 0)
+
+        log_freqs = np.empty((len(self.classes), len(symbol_ids)))
+        for i in range(len(self.classes)):
+            log_freqs[i] = get_log_freqs(counts[i, symbol_ids], sizes[i])
+
+        ratios = log_freqs[self.pairs[:, 0]] - log_freqs[self.pairs[:, 1]]
+
+        return symbol_ids, ratios
+
+
+def get_vocabulary_digest(data):
+    return np.frombuffer(hashlib.sha256(data.tobytes()).digest(),
+            dtype=np.uint8)
+
+
+def save_vocabulary(lr_dir, symbols):
+    # Written to a temporary file first: runs sharing lr_dir (with and
+    # without OS classes) never see a partially written vocabulary.
+    fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=lr_dir)
+    with os.fdopen(fd, 'wb') as stream:
+        np.save(stream, encode_names(symbols))
+    os.replace(tmp_path, os.path.join(lr_dir, VOCABULARY_NAME))
+    load_vocabulary.cache_clear()
+
+
+@functools.lru_cache(maxsize=4)
+def load_vocabulary(vocabulary_path):
+    data = np.load(vocabulary_path)
+    return decode_names(data), get_vocabulary_digest(data)
+
+
+def truncate_to_float32(values):
+    # Round toward zero rather than to nearest: |x| >= t then gives the same
+    # answer on the float32 values as on the original ones for every
+    # threshold t representable in float32 (e.g. the log10(10) = 1 used for
+    # the plots).
+    result = values.astype(np.float32)
+    rounded_up = np.abs(result.astype(values.dtype)) > np.abs(values)
+    result[rounded_up] = np.nextafter(result[rounded_up], np.float32(0))
+    return result
+
+
+class LikelihoodRatios:
+    # Ratios of one leave-one-device-out fold. symbol_ids index the
+    # vocabulary shared by all the folds in the same directory (symbols.npy);
+    # ratios holds one float32 row per class pair and max_abs_ratio the
+    # largest |LR| of every symbol, kept in float64 so that thresholding gives
+    # the same symbols as the full precision ratios.
+
+    def __init__(self, symbols, symbol_ids, classes, pairs, ratios,
+            max_abs_ratio):
+        self.symbols = symbols
+        self.symbol_ids = symbol_ids
+        self.classes = classes
+        self.pairs = pairs
+        self.ratios = ratios
+        self.max_abs_ratio = max_abs_ratio
+
+    @classmethod
+    def from_engine(cls, engine, excluded_device=None):
+        symbol_ids, ratios = engine.get_ratios(excluded_device)
+
+        if len(ratios) > 0:
+            max_abs_ratio = np.abs(ratios).max(axis=0)
+        else:
+            max_abs_ratio = np.zeros(len(symbol_ids))
+
+        return cls(engine.symbols, symbol_ids.astype(np.int32),
+                list(engine.classes), engine.pairs.astype(np.int32),
+                truncate_to_float32(ratios), max_abs_ratio)
+
+    @classmethod
+    def load(cls, lr_path, load_ratios=True):
+        vocabulary_path = os.path.join(os.path.dirname(lr_path),
+                VOCABULARY_NAME)
+        symbols, digest = load_vocabulary(vocabulary_path)
+
+        with np.load(lr_path, allow_pickle=False) as data:
+            if int(data['version']) != FORMAT_VERSION:
+                raise ValueError("Unsupported likelihood ratios format "
+                        "version {}".format(int(data['version'])))
+
+            if not np.array_equal(data['vocabulary_digest'], digest):
+                raise ValueError("{} does not match the vocabulary in {}"
+                        .format(lr_path, vocabulary_path))
+
+            classes = [tuple(x) for x in data['classes'].tolist()]
+            ratios = data['ratios'] if load_ratios else None
+
+            return cls(symbols, data['symbol_ids'], classes, data['pairs'],
+                    ratios, data['max_abs_ratio'])
+
+    def save(self, lr_path):
+        vocabulary_path = os.path.join(os.path.dirname(lr_path),
+                VOCABULARY_NAME)
+        symbols, digest = load_vocabulary(vocabulary_path)
+
+        with open(lr_path, 'wb') as stream:
+            np.savez(stream, version=np.array(FORMAT_VERSION),
+                    vocabulary_digest=digest,
+                    symbol_ids=self.symbol_ids,
+                    classes=np.array(self.classes, dtype=str).reshape(
+                        len(self.classes), -1),
+                    pairs=self.pairs, ratios=self.ratios,
+                    max_abs_ratio=self.max_abs_ratio)
+
+    def get_symbols(self):
+        return [self.symbols[i] for i in self.symbol_ids]
+
+    def select_symbols(self, threshold):
+        # Same as keeping every symbol with ratio <= -threshold or
+        # ratio >= threshold for at least one pair of classes.
+        selected = self.symbol_ids[self.max_abs_ratio >= threshold]
+        return [self.symbols[i] for i in selected]
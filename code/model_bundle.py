@@ -0,0 +1,64 @@
+# @License: GPL-3.0-or-later
+# @Copyright: Copyright (C) 2021  Università degli studi di Firenze
+
+import numpy as np
+
+from compiled_tree import CompiledTree
+
+
+FORMAT_VERSION = 2
+
+TREE_ARRAYS = ('feature', 'absent_child', 'present_child', 'leaf_class')
+
+
+class ModelBundle:
+    # One fold model ready for serving: the compiled tree, the names of the
+    # classes it predicts (class_names[i] for prediction i), the device left
+    # out when it was fitted and whether its symbols keep the final numbers
+    # of element names (1-create_dataset.py --keep-final-number). Bundles
+    # are .npz files without pickled objects, so loading one only needs
+    # numpy.
+
+    def __init__(self, tree, class_names, device_id=None,
+            keep_final_number=False):
+        self.tree = tree
+        self.class_names = list(class_names)
+        self.device_id = device_id
+        self.keep_final_number = keep_final_number
+
+    @classmethod
+    def from_result(cls, result, device_id, keep_final_number=False):
+        # result is the tuple stored in the pickles of scripts 3-5.
+        chosen_classes, run_symbols, classifiers, y_true, y_pred = result
+        tree = CompiledTree.from_classifier(classifiers[device_id],
+                run_symbols[device_id])
+        return cls(tree, chosen_classes, device_id, keep_final_number)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            if int(data['version']) != FORMAT_VERSION:
+                raise ValueError("Unsupported model bundle format version "
+                        "{}".format(int(data['version'])))
+
+            tree = CompiledTree(data['symbols'].tolist(),
+                    *[data[name] for name in TREE_ARRAYS], data['classes'])
+            class_names = data['class_names'].tolist()
+            device_id = str(data['device_id']) or None
+            keep_final_number = bool(data['keep_final_number'])
+
+        return cls(tree, class_names, device_id, keep_final_number)
+
+    def save(self, path):
+        tree = self.tree
+        arrays = {name: getattr(tree, name) for name in TREE_ARRAYS}
+        np.savez_compressed(path, version=np.array(FORMAT_VERSION),
+                symbols=np.array(tree.symbols, dtype=str),
+                classes=tree.classes,
+                class_names=np.array(self.class_names, dtype=str),
+                device_id=np.array(self.device_id or ''),
+                keep_final_number=np.array(self.keep_final_number),
+                **arrays)
+
+    def get_class_name(self, prediction):
+        return self.class_names[prediction]
@@ -0,0 +1,566 @@
+#!/usr/bin/env python3
+# @License: GPL-3.0-or-later
+# @Copyright: Copyright (C) 2021  Università degli studi di Firenze
+
+import argparse
+import concurrent.futures
+import importlib
+import inspect
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+import sklearn
+
+import common_defs
+from artifact_cache import ArtifactCache, get_files_digest, get_key, \
+        get_sources_digest
+from common_defs import CLASSIFIERS, SOCIAL_CLASSES, load_dataset
+from fold_planner import FoldPlanner
+
+
+TRAINING_SCRIPTS = [
+    ('tampering-detector', '3-train_tampering_detector'),
+    ('tampering-classifier', '4-train_tampering_classifier'),
+    ('blind-classifier', '5-train_blind_classifier'),
+]
+
+OS_VARIANTS = ['no-os', 'os']
+
+LR_VARIANTS = ['no-lr', 'lr']
+
+REPORT_SCRIPTS = {
+    'cm': '6a-plot-confusion-matrix',
+    'acc': '6b-print-accuracy-by-device',
+    'trees': '6c-plot-trees',
+}
+
+
+def load_script(name):
+    return importlib.import_module(name)
+
+
+def parse_script_args(name, argv):
+    return load_script(name).get_parser().parse_args(argv)
+
+
+class Node:
+    # One step of the experiment. function receives the results of the
+    # nodes listed in deps (by name) and returns its own result. Nodes with
+    # the same lock never run at the same time; output_path, if given,
+    # receives what the node prints, which with echo is also shown on the
+    # console (as tee did in run_all.sh).
+    #
+    # A node with a cache_key (called once the dependencies are done) is
+    # skipped when the artifact cache holds that key: cache_path (a file or
+    # a directory) is then restored from the cache instead. stages lists the
+    # (stage name, key) pairs reported by --dry-run; a None key means that
+    # the stage cannot be looked up before the dataset is built.
+
+    def __init__(self, name, function, deps=(), output_path=None, echo=False,
+            lock=None, cache_key=None, cache_path=None, stages=None):
+        self.name = name
+        self.function = function
+        self.deps = list(deps)
+        self.output_path = output_path
+        self.echo = echo
+        self.lock = lock
+        self.cache_key = cache_key
+        self.cache_path = cache_path
+        self.stages = stages
+
+    def get_stages(self):
+        if self.stages is not None:
+            return self.stages()
+        if self.cache_key is not None:
+            return [(self.name, self.cache_key())]
+        return []
+
+
+class NodeOutput:
+    # Replacement for sys.stdout sending what each thread prints to the
+    # output of the node it is running. Echoed output is copied to the
+    # default stream a whole line at a time, so that the lines of nodes
+    # running at the same time are not mixed up.
+
+    def __init__(self, default):
+        self.default = default
+        self.local = threading.local()
+        self._lock = threading.Lock()
+
+    def get_stream(self):
+        return getattr(self.local, 'stream', None) or self.default
+
+    def set_stream(self, stream, echo=False):
+        self.local.stream = stream
+        self.local.echo = echo
+        self.local.line = ''
+
+    def write(self, text):
+        stream = self.get_stream()
+        if stream is not self.default and getattr(self.local, 'echo', False):
+            lines = (self.local.line + text).split('\n')
+            self.local.line = lines.pop()
+            if lines:
+                self.echo(''.join(line + '\n' for line in lines))
+        return stream.write(text)
+
+    def echo(self, text):
+        with self._lock:
+            self.default.write(text)
+
+    def flush(self):
+        self.get_stream().flush()
+
+
+def run_node(node, results, output, cache):
+    key = None
+    if cache is not None and node.cache_key is not None:
+        key = node.cache_key()
+        if cache.get_files(key, node.cache_path):
+            print("Restored {} from the cache".format(node.name),
+                    file=output.default)
+            return None
+
+    result = execute_node(node, results, output)
+
+    if key is not None:
+        cache.put_files(key, node.cache_path)
+
+    return result
+
+
+def execute_node(node, results, output):
+    inputs = {name: results[name] for name in node.deps}
+
+    if node.output_path is not None:
+        os.makedirs(os.path.dirname(node.output_path) or '.', exist_ok=True)
+        stream = open(node.output_path, 'w')
+    else:
+        stream = None
+
+    output.set_stream(stream, node.echo)
+    try:
+        if node.lock is not None:
+            with node.lock:
+                return node.function(inputs)
+        return node.function(inputs)
+    finally:
+        if node.echo and output.local.line:
+            output.echo(output.local.line + '\n')
+        output.set_stream(None)
+        if stream is not None:
+            stream.close()
+
+
+def run_graph(nodes, jobs, cache=None):
+    # Runs every node once all of its dependencies are done, up to jobs
+    # nodes at a time, in the order they are listed whenever more than one
+    # is ready. After a failure no new node is started; the first error is
+    # raised once the running nodes are over.
+    pending = list(nodes)
+    results = {}
+    running = {}
+    error = None
+
+    output = NodeOutput(sys.stdout)
+    sys.stdout = output
+
+    try:
+        with concurrent.futures.ThreadPoolExecutor(jobs) as executor:
+            while pending or running:
+                for node in list(pending):
+                    if error is not None or len(running) >= jobs:
+                        break
+                    if all(name in results for name in node.deps):
+                        pending.remove(node)
+                        print("Starting {}".format(node.name),
+                                file=output.default)
+                        future = executor.submit(run_node, node, results,
+                                output, cache)
+                        running[future] = (node, time.time())
+
+                if not running:
+                    break
+
+                done, _ = concurrent.futures.wait(running,
+                        return_when=concurrent.futures.FIRST_COMPLETED)
+
+                for future in done:
+                    node, start = running.pop(future)
+                    try:
+                        results[node.name] = future.result()
+                    except Exception as e:
+                        print("Failed {}: {!r}".format(node.name, e),
+                                file=output.default)
+                        if error is None:
+                            error = e
+                    else:
+                        print("Done {} ({:.1f} s)".format(node.name,
+                            time.time() - start), file=output.default)
+    finally:
+        sys.stdout = output.default
+
+    if error is not None:
+        raise error
+
+    if pending:
+        raise ValueError("Unsatisfiable dependencies for {}".format(
+            ', '.join(node.name for node in pending)))
+
+    return results
+
+
+class StageKeys:
+    # Cache keys of the experiment stages. A key hashes the parameters of
+    # the stage, the source of the code it runs and the keys (or, for the
+    # dataset, the content digest) of its inputs, so editing e.g.
+    # get_classifier() only invalidates the models and their reports.
+
+    def __init__(self, args):
+        self.args = args
+        self.dataset = None
+        self.dataset_digest = None
+        self._dataset_key = None
+
+        self.dataset_sources = get_key(
+                get_sources_digest('1-create_dataset', 'container_archive',
+                    'container_symbols', 'symbol_cache', 'encoded_dataset'),
+                common_defs.SOCIAL_CLASSES, common_defs.MANIPULATION_CLASSES)
+        self.lr_sources = get_key(
+                get_sources_digest('2-eval_likelihood_ratios',
+                    'likelihood_ratios', 'encoded_dataset'),
+                inspect.getsource(common_defs.get_info_for_device),
+                common_defs.BRANDS_FOR_DEVICES)
+        self.fold_sources = get_key(
+                get_sources_digest('fold_planner', 'encoded_dataset',
+                    'likelihood_ratios', 'common_defs'),
+                sklearn.__version__)
+        self.script_sources = {name: get_sources_digest(name)
+                for name in [x[1] for x in TRAINING_SCRIPTS] +
+                list(REPORT_SCRIPTS.values()) + ['6d-plot-lr']}
+
+    def set_dataset(self, dataset):
+        arrays = dataset.to_arrays()
+        self.dataset = dataset
+        self.dataset_digest = get_key(*[part for name in sorted(arrays)
+            for part in (name, np.ascontiguousarray(arrays[name]).tobytes())])
+
+    def get_device_ids(self):
+        return None if self.dataset is None else list(self.dataset.device_ids)
+
+    def get_dataset_key(self):
+        if self._dataset_key is None:
+            self._dataset_key = get_key('dataset', self.dataset_sources,
+                    get_files_digest(self.args.containers_path))
+        return self._dataset_key
+
+    def get_lr_key(self, os_variant, device_id):
+        if self.dataset_digest is None:
+            return None
+        return get_key('lr', self.lr_sources, self.dataset_digest,
+                os_variant, device_id)
+
+    def get_fold_key(self, script_name, os_variant, lr_variant, item,
+            device_id):
+        if self.dataset_digest is None:
+            return None
+        lr_key = None
+        if lr_variant == 'lr':
+            lr_key = self.get_lr_key(os_variant, device_id)
+        return get_key('fold', self.fold_sources,
+                self.script_sources[script_name], self.dataset_digest,
+                os_variant, lr_key, item, device_id, self.args.seed,
+                self.args.classifier)
+
+    def get_report_key(self, kind, script_name, os_variant, lr_variant, item):
+        device_ids = self.get_device_ids()
+        if device_ids is None:
+            return None
+        return get_key('report', kind,
+                self.script_sources[REPORT_SCRIPTS[kind]],
+                [self.get_fold_key(script_name, os_variant, lr_variant, item,
+                    device_id) for device_id in device_ids])
+
+    def get_plot_lr_key(self):
+        device_ids = self.get_device_ids()
+        if device_ids is None:
+            return None
+        return get_key('plot-lr', self.script_sources['6d-plot-lr'],
+                [self.get_lr_key('no-os', x) for x in device_ids])
+
+
+class FoldCache:
+    # Per-fold results of one training run in the artifact cache, in the
+    # form expected by run_folds().
+
+    def __init__(self, cache, keys, script_name, os_variant, lr_variant):
+        self.cache = cache
+        self.keys = keys
+        self.script_name = script_name
+        self.os_variant = os_variant
+        self.lr_variant = lr_variant
+
+    def get_key(self, item, device_id):
+        return self.keys.get_fold_key(self.script_name, self.os_variant,
+                self.lr_variant, item, device_id)
+
+    def get(self, item, device_id):
+        return self.cache.get(self.get_key(item, device_id))
+
+    def put(self, item, device_id, result):
+        self.cache.put(self.get_key(item, device_id), result)
+
+
+def get_experiment_nodes(args, keys, cache=None):
+    nodes = []
+    bokeh_lock = threading.Lock()
+
+    def create_dataset(inputs):
+        script_args = parse_script_args('1-create_dataset', ['--format',
+            'store', '--workers', str(args.workers), args.containers_path,
+            args.dataset_path])
+        load_script('1-create_dataset').main(script_args)
+
+    def open_dataset(inputs):
+        dataset = load_dataset(args.dataset_path)
+        keys.set_dataset(dataset)
+        return dataset
+
+    def create_planner(inputs):
+        return FoldPlanner(inputs['open-dataset'],
+                cache_size=args.fold_cache_size * 1024 * 1024)
+
+    if not args.skip_dataset:
+        nodes.append(Node('create-dataset', create_dataset,
+            cache_key=keys.get_dataset_key, cache_path=args.dataset_path))
+        nodes.append(Node('open-dataset', open_dataset, ['create-dataset']))
+    else:
+        nodes.append(Node('open-dataset', open_dataset))
+
+    nodes.append(Node('planner', create_planner, ['open-dataset']))
+
+    for os_variant in OS_VARIANTS:
+        node_name = 'lr-{}'.format(os_variant)
+
+        def compute_ratios(inputs, os_variant=os_variant):
+            argv = ['--workers', str(args.workers)]
+            if os_variant == 'os':
+                argv.append('--use-os-info')
+            script_args = parse_script_args('2-eval_likelihood_ratios',
+                    argv + [args.dataset_path, args.lr_path])
+
+            missing = []
+            for device_id in keys.get_device_ids():
+                lr_path = common_defs.get_likelihood_path(args.lr_path,
+                        device_id, os_variant == 'os')
+                key = keys.get_lr_key(os_variant, device_id)
+                if cache is None or not cache.get_files(key, lr_path):
+                    missing.append((device_id, lr_path, key))
+
+            load_script('2-eval_likelihood_ratios').compute_ratios(
+                    script_args, inputs['open-dataset'],
+                    [device_id for device_id, _, _ in missing])
+
+            if cache is not None:
+                for device_id, lr_path, key in missing:
+                    cache.put_files(key, lr_path)
+
+        def get_lr_stages(node_name=node_name, os_variant=os_variant):
+            device_ids = keys.get_device_ids()
+            if device_ids is None:
+                return [(node_name, None)]
+            return [('{}/{}'.format(node_name, device_id),
+                keys.get_lr_key(os_variant, device_id))
+                for device_id in device_ids]
+
+        nodes.append(Node(node_name, compute_ratios, ['open-dataset'],
+            stages=get_lr_stages))
+
+    def plot_ratios(inputs):
+        script_args = parse_script_args('6d-plot-lr', [args.lr_path,
+            os.path.join(args.lr_path, 'plots')])
+        load_script('6d-plot-lr').main(script_args)
+
+    nodes.append(Node('plot-lr', plot_ratios, ['lr-no-os'], lock=bokeh_lock,
+        cache_key=keys.get_plot_lr_key,
+        cache_path=os.path.join(args.lr_path, 'plots')))
+
+    for experiment, script_name in TRAINING_SCRIPTS:
+        for lr_variant in LR_VARIANTS:
+            for os_variant in OS_VARIANTS:
+                results_path = os.path.join(args.results_path, experiment,
+                        os_variant, lr_variant)
+                log_name = '-'.join([experiment] +
+                        (['os'] if os_variant == 'os' else []) +
+                        (['lr'] if lr_variant == 'lr' else [])) + '.log'
+                node_name = 'train-{}-{}-{}'.format(experiment, os_variant,
+                        lr_variant)
+
+                if experiment == 'blind-classifier':
+                    items = ['blind']
+                else:
+                    items = SOCIAL_CLASSES
+
+                argv = ['--seed', str(args.seed), '--classifier',
+                        args.classifier, '--classifier-jobs',
+                        str(args.classifier_jobs)]
+                deps = ['open-dataset', 'planner']
+                if lr_variant == 'lr':
+                    argv.extend(['--likelihood-ratios-path', args.lr_path])
+                    deps.append('lr-{}'.format(os_variant))
+                if os_variant == 'os':
+                    argv.append('--use-os-info')
+
+                def train(inputs, script_name=script_name,
+                        argv=argv + [args.dataset_path, results_path],
+                        os_variant=os_variant, lr_variant=lr_variant):
+                    script_args = parse_script_args(script_name, argv)
+                    fold_cache = None
+                    if cache is not None:
+                        fold_cache = FoldCache(cache, keys, script_name,
+                                os_variant, lr_variant)
+                    return load_script(script_name).train(script_args,
+                            inputs['open-dataset'], inputs['planner'],
+                            fold_cache)
+
+                def get_fold_stages(node_name=node_name,
+                        script_name=script_name, os_variant=os_variant,
+                        lr_variant=lr_variant, items=items):
+                    device_ids = keys.get_device_ids()
+                    if device_ids is None:
+                        return [(node_name, None)]
+                    return [('{}/{}/{}'.format(node_name, item, device_id),
+                        keys.get_fold_key(script_name, os_variant, lr_variant,
+                            item, device_id))
+                        for item in items for device_id in device_ids]
+
+                nodes.append(Node(node_name, train, deps,
+                    output_path=os.path.join(args.logs_path, log_name),
+                    echo=True, stages=get_fold_stages))
+
+                for item in items:
+                    def get_report_key(kind, script_name=script_name,
+                            os_variant=os_variant, lr_variant=lr_variant,
+                            item=item):
+                        return lambda: keys.get_report_key(kind, script_name,
+                                os_variant, lr_variant, item)
+
+                    def plot_cm(inputs, node_name=node_name, item=item,
+                            output_path=os.path.join(results_path,
+                                item + '-cm.html')):
+                        load_script('6a-plot-confusion-matrix') \
+                                .plot_confusion_matrix(
+                                        inputs[node_name][item], output_path)
+
+                    def print_accuracy(inputs, node_name=node_name,
+                            item=item):
+                        load_script('6b-print-accuracy-by-device') \
+                                .print_accuracy_by_device(
+                                        inputs[node_name][item])
+
+                    def export_trees(inputs, node_name=node_name, item=item,
+                            output_path=os.path.join(results_path, 'trees',
+                                item)):
+                        load_script('6c-plot-trees').export_trees(
+                                inputs[node_name][item], output_path)
+
+                    acc_path = os.path.join(results_path, item + '-acc.txt')
+
+                    nodes.append(Node('{}-{}-cm'.format(node_name, item),
+                        plot_cm, [node_name], lock=bokeh_lock,
+                        cache_key=get_report_key('cm'),
+                        cache_path=os.path.join(results_path,
+                            item + '-cm.html')))
+                    nodes.append(Node('{}-{}-acc'.format(node_name, item),
+                        print_accuracy, [node_name], output_path=acc_path,
+                        cache_key=get_report_key('acc'), cache_path=acc_path))
+                    if args.classifier == 'tree':
+                        nodes.append(Node('{}-{}-trees'.format(node_name,
+                            item), export_trees, [node_name],
+                            cache_key=get_report_key('trees'),
+                            cache_path=os.path.join(results_path, 'trees',
+                                item)))
+
+    return nodes
+
+
+def print_dry_run(args, nodes, keys, cache):
+    # Stages are looked up without touching the cache. Unless the dataset
+    # is reused as is (--skip-dataset) it is opened from the cache, when
+    # there; otherwise every stage depending on it is reported as to run.
+    dataset_path = None
+    if args.skip_dataset:
+        dataset_path = args.dataset_path
+    elif cache is not None and keys.get_dataset_key() in cache:
+        dataset_path = cache.get_files_path(keys.get_dataset_key())
+
+    if dataset_path is not None:
+        keys.set_dataset(load_dataset(dataset_path))
+
+    n_run = 0
+    n_cached = 0
+
+    for node in nodes:
+        for stage_name, key in node.get_stages():
+            if cache is not None and key is not None and key in cache:
+                n_cached += 1
+            else:
+                n_run += 1
+                print("run {}".format(stage_name))
+
+    print("{} stages to run, {} cached".format(n_run, n_cached))
+
+
+def get_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--containers-path', type=str, default='Containers')
+    parser.add_argument('--dataset-path', type=str, default='dataset')
+    parser.add_argument('--lr-path', type=str, default='likelihood_ratios')
+    parser.add_argument('--results-path', type=str, default='results')
+    parser.add_argument('--logs-path', type=str, default='logs')
+    parser.add_argument('--skip-dataset', action='store_true')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--classifier', choices=sorted(CLASSIFIERS),
+            default='tree')
+    parser.add_argument('--classifier-jobs', type=int, default=1)
+    parser.add_argument('--fold-cache-size', type=int, default=1024,
+            help='megabytes of fold matrices shared between experiments')
+    parser.add_argument('--cache-path', type=str, default='artifacts')
+    parser.add_argument('--cache-size', type=int, default=4096,
+            help='megabytes of stage results kept in the artifact cache')
+    parser.add_argument('--no-cache', action='store_true')
+    parser.add_argument('--dry-run', action='store_true')
+
+    return parser
+
+
+def main(args):
+    cache = None
+    if not args.no_cache:
+        cache = ArtifactCache(args.cache_path, args.cache_size * 1024 * 1024)
+
+    keys = StageKeys(args)
+    nodes = get_experiment_nodes(args, keys, cache)
+
+    if args.dry_run:
+        print_dry_run(args, nodes, keys, cache)
+        return
+
+    if cache is not None:
+        cache.evict()
+
+    run_graph(nodes, args.jobs, cache)
+
+    if cache is not None:
+        print("Artifact cache: {}".format(cache.get_stats()))
+
+
+if __name__ == '__main__':
+    parser = get_parser()
+    args = parser.parse_args()
+    main(args)
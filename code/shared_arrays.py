@@ -0,0 +1,64 @@
+# @License: GPL-3.0-or-later
+# @Copyright: Copyright (C) 2021  Università degli studi di Firenze
+
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+class SharedArrays:
+    # Copies a dict of arrays into shared memory segments, one per array.
+    # spec is small and picklable: other processes pass it to attach_arrays()
+    # to map the same segments instead of receiving copies of the arrays.
+    # The segments are unlinked by release(), which the context manager
+    # calls on normal exit, on exceptions and on KeyboardInterrupt.
+
+    def __init__(self, arrays):
+        self.segments = []
+        self.spec = {}
+
+        try:
+            for name, array in arrays.items():
+                array = np.ascontiguousarray(array)
+                segment = shared_memory.SharedMemory(create=True,
+                        size=max(array.nbytes, 1))
+                self.segments.append(segment)
+
+                view = np.ndarray(array.shape, dtype=array.dtype,
+                        buffer=segment.buf)
+                view[...] = array
+                del view
+
+                self.spec[name] = (segment.name, array.shape, array.dtype.str)
+        except BaseException:
+            self.release()
+            raise
+
+    def release(self):
+        while self.segments:
+            segment = self.segments.pop()
+            segment.close()
+            segment.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+def attach_arrays(spec):
+    # Returns read-only views of the published arrays and the segments they
+    # live in; the segments must be kept referenced while the views are used.
+    arrays = {}
+    segments = []
+
+    for name, (segment_name, shape, dtype) in spec.items():
+        segment = shared_memory.SharedMemory(name=segment_name)
+        segments.append(segment)
+
+        array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=segment.buf)
+        array.flags.writeable = False
+        arrays[name] = array
+
+    return arrays, segments
@@ -0,0 +1,92 @@
+# @License: GPL-3.0-or-later
+# @Copyright: Copyright (C) 2021  Università degli studi di Firenze
+
+import hashlib
+import os
+import pickle
+import sys
+
+from container_symbols import IGNORED_SYMBOLS
+
+
+CACHE_VERSION = 2
+
+
+def get_options_digest(keep_final_number):
+    options = (CACHE_VERSION, bool(keep_final_number), sorted(IGNORED_SYMBOLS))
+    return hashlib.sha256(repr(options).encode('utf-8')).digest()
+
+
+class SymbolCache:
+    # Symbols extracted from each container, keyed by the hash of the file
+    # contents and of the extractor options. Entries are kept only as long as
+    # some container with that name is still listed: files are tracked by
+    # name, one key per options digest.
+
+    def __init__(self, path, keep_final_number):
+        self.path = path
+        self.options = get_options_digest(keep_final_number)
+        self.entries = {}
+        self.files = {}
+        self.present = set()
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+        if os.path.exists(path):
+            with open(path, 'rb') as stream:
+                version, self.entries, self.files = pickle.load(stream)
+
+            if version != CACHE_VERSION:
+                self.entries = {}
+                self.files = {}
+
+    def get_key(self, data):
+        return hashlib.sha256(self.options + data).hexdigest()
+
+    def mark_present(self, name):
+        self.present.add(name)
+
+    def get(self, name, data):
+        key = self.get_key(data)
+
+        self.mark_present(name)
+        self.files.setdefault(name, {})[self.options] = key
+
+        symbols = self.entries.get(key)
+
+        if symbols is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        return key, symbols
+
+    def put(self, key, symbols):
+        self.entries[key] = [sys.intern(x) for x in symbols]
+
+    def evict(self):
+        self.files = {name: keys for name, keys in self.files.items()
+                if name in self.present}
+
+        referenced = set()
+        for keys in self.files.values():
+            referenced.update(keys.values())
+
+        entries = {key: symbols for key, symbols in self.entries.items()
+                if key in referenced}
+        self.evicted += len(self.entries) - len(entries)
+        self.entries = entries
+
+    def save(self):
+        self.evict()
+
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as stream:
+            pickle.dump((CACHE_VERSION, self.entries, self.files), stream,
+                    pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
+
+    def get_stats(self):
+        return "{} hits, {} misses, {} evicted, {} entries".format(
+                self.hits, self.misses, self.evicted, len(self.entries))